@@ -0,0 +1,39 @@
+"""Compare two benchmark reports written by run.py.
+
+    python benchmarks/compare.py before.json after.json
+"""
+import argparse
+import json
+
+METRICS = ("p50_ms", "p95_ms", "rows_per_sec", "peak_rss_mb")
+
+
+def load_results(path: str) -> dict:
+    with open(path) as f:
+        report = json.load(f)
+    return {(r["scenario"], r["schema"], r["rows"]): r for r in report["results"] if r.get("status") == "ok"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    baseline = load_results(args.baseline)
+    candidate = load_results(args.candidate)
+    print(f"{'scenario':<18}{'schema':<8}{'rows':>9}  " + "".join(f"{m:>22}" for m in METRICS))
+    for key in sorted(baseline.keys() & candidate.keys(), key=lambda k: (k[0], k[1], k[2])):
+        cells = []
+        for metric in METRICS:
+            before, after = baseline[key].get(metric), candidate[key].get(metric)
+            if not before or after is None:
+                cells.append(f"{'-':>22}")
+                continue
+            cells.append(f"{after:>12.1f} ({(after - before) / before:+7.1%})")
+        scenario, schema, rows = key
+        print(f"{scenario:<18}{schema:<8}{rows:>9}  " + "".join(cells))
+
+
+if __name__ == "__main__":
+    main()
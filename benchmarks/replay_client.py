@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from types import SimpleNamespace
+
+from services.telemetry import contents_to_text, response_to_text
+
+
+def request_key(model: str, contents, config) -> str:
+    system_instruction = getattr(config, "system_instruction", None) if config is not None else None
+    payload = json.dumps([model, contents_to_text(contents), system_instruction], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def make_response(text: str | None, prompt_tokens: int, output_tokens: int, function_call: dict | None = None):
+    call = SimpleNamespace(name=function_call["name"], args=function_call["args"]) if function_call else None
+    part = SimpleNamespace(text=text, function_call=call)
+    return SimpleNamespace(
+        text=text,
+        candidates=[SimpleNamespace(content=SimpleNamespace(role="model", parts=[part]))],
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens
+        )
+    )
+
+
+class SyntheticResponder:
+    """Deterministic stand-in answers for every prompt the services send."""
+
+    def __init__(self, workload):
+        self.workload = workload
+        self._data_cache = {}
+
+    def respond(self, contents, config) -> tuple[str | None, dict | None]:
+        prompt = contents_to_text(contents)
+        system_instruction = getattr(config, "system_instruction", None) or ""
+
+        if getattr(config, "tools", None):
+            question = prompt.split("User question:", 1)[-1]
+            name = "plot_generator" if "plot" in question.lower() else "sql_generation"
+            return None, {"name": name, "args": {"user_query": question.strip()}}
+        if "returns a JSON array of table names" in system_instruction:
+            available = re.search(r"Available tables: (.*)", prompt)
+            tables = available.group(1).split(", ") if available else []
+            return json.dumps(tables[:1]), None
+        if "security validator" in prompt or "You are a data validator" in prompt:
+            return "OK", None
+        if "You are a data generator" in prompt:
+            return self.dataset_json(self.workload.table_names), None
+        if "data editor" in prompt:
+            edited = re.search(r'"table_name": "(\w+)"', prompt)
+            return self.dataset_json([edited.group(1)] if edited else self.workload.table_names[:1]), None
+        if "Seaborn" in prompt or "invalid plot code" in prompt:
+            return self.workload.plot_code, None
+        if "SQL" in prompt:
+            return self.workload.query, None
+        return "OK", None
+
+    def dataset_json(self, table_names: list[str]) -> str:
+        key = tuple(table_names)
+        if key not in self._data_cache:
+            self._data_cache[key] = json.dumps([
+                {"table_name": name, "rows": self.workload.rows_for(name)} for name in table_names
+            ])
+        return self._data_cache[key]
+
+
+class ReplayModels:
+    def __init__(self, responder: SyntheticResponder, fixtures: dict, real_models=None):
+        self._responder = responder
+        self._fixtures = fixtures
+        self._real_models = real_models
+        self._lock = threading.Lock()
+        self.tokens = {"input": 0, "output": 0, "total": 0}
+        self.calls = 0
+
+    def generate_content(self, model: str, contents, config=None):
+        key = request_key(model, contents, config)
+        if self._real_models is not None:
+            response = self._real_models.generate_content(model=model, contents=contents, config=config)
+            part = response.candidates[0].content.parts[0]
+            self._fixtures[key] = {
+                "text": None if part.function_call else response_to_text(response),
+                "function_call": {"name": part.function_call.name, "args": dict(part.function_call.args or {})} if part.function_call else None,
+                "prompt_tokens": response.usage_metadata.prompt_token_count or 0,
+                "output_tokens": response.usage_metadata.candidates_token_count or 0,
+            }
+        if key in self._fixtures:
+            fixture = self._fixtures[key]
+            response = make_response(fixture["text"], fixture["prompt_tokens"], fixture["output_tokens"], fixture["function_call"])
+        else:
+            text, function_call = self._responder.respond(contents, config)
+            prompt_tokens = len(contents_to_text(contents)) // 4
+            output_tokens = len(text or json.dumps(function_call)) // 4
+            response = make_response(text, prompt_tokens, output_tokens, function_call)
+
+        with self._lock:
+            self.calls += 1
+            self.tokens["input"] += response.usage_metadata.prompt_token_count
+            self.tokens["output"] += response.usage_metadata.candidates_token_count
+            self.tokens["total"] += response.usage_metadata.total_token_count
+        return response
+
+    def reset_counters(self):
+        with self._lock:
+            self.tokens = {"input": 0, "output": 0, "total": 0}
+            self.calls = 0
+
+
+class ReplayClient:
+    """Drop-in for genai.Client: replays recorded fixtures, falls back to synthetic answers.
+
+    With `real_client` set, every call goes to the real API and the response is
+    recorded so later runs can replay it offline.
+    """
+
+    def __init__(self, workload, fixtures_path: str | None = None, real_client=None):
+        self.fixtures_path = fixtures_path
+        fixtures = {}
+        if fixtures_path and os.path.exists(fixtures_path):
+            with open(fixtures_path) as f:
+                fixtures = json.load(f)
+        self.models = ReplayModels(
+            SyntheticResponder(workload),
+            fixtures,
+            real_client.models if real_client is not None else None
+        )
+
+    def save_fixtures(self):
+        if self.fixtures_path:
+            with open(self.fixtures_path, "w") as f:
+                json.dump(self.models._fixtures, f)
@@ -0,0 +1,71 @@
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+SCHEMA_SIZES = {"small": 3, "medium": 20, "large": 200}
+STATUSES = ("active", "inactive", "pending")
+CITIES = ("Warsaw", "Krakow", "Gdansk", "Wroclaw", "Poznan", "Lodz")
+
+
+@dataclass
+class Workload:
+    schema: str
+    rows: int
+    table_names: list[str] = field(init=False)
+    ddl: str = field(init=False)
+    _rows_cache: dict = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        self.table_names = [f"bench_t{i}" for i in range(SCHEMA_SIZES[self.schema])]
+        self.ddl = "\n\n".join(self.table_ddl(i) for i in range(len(self.table_names)))
+
+    def table_ddl(self, index: int) -> str:
+        name = self.table_names[index]
+        columns = [
+            "id INT PRIMARY KEY",
+            "name VARCHAR(100)",
+            "city VARCHAR(50)",
+            "amount DECIMAL(10,2)",
+            "created_at DATETIME",
+            f"{name}_status ENUM('active','inactive','pending')",
+        ]
+        if index > 0:
+            parent = self.table_names[index - 1]
+            columns.append(f"{parent}_id INT")
+            columns.append(f"FOREIGN KEY ({parent}_id) REFERENCES {parent}(id)")
+        body = ",\n  ".join(columns)
+        return f"CREATE TABLE {name} (\n  {body}\n);"
+
+    def rows_for(self, table_name: str) -> list[dict]:
+        if table_name not in self._rows_cache:
+            index = self.table_names.index(table_name)
+            rng = random.Random(index)
+            start = datetime(2024, 1, 1)
+            parent = self.table_names[index - 1] if index > 0 else None
+            rows = []
+            for i in range(1, self.rows + 1):
+                row = {
+                    "id": i,
+                    "name": f"{table_name}_{i}",
+                    "city": CITIES[i % len(CITIES)],
+                    "amount": round(rng.uniform(1, 10000), 2),
+                    "created_at": (start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"),
+                    f"{table_name}_status": STATUSES[i % len(STATUSES)],
+                }
+                if parent:
+                    row[f"{parent}_id"] = rng.randint(1, self.rows)
+                rows.append(row)
+            self._rows_cache[table_name] = rows
+        return self._rows_cache[table_name]
+
+    @property
+    def query(self) -> str:
+        return f"SELECT * FROM {self.table_names[0]}"
+
+    @property
+    def plot_code(self) -> str:
+        return "sns.scatterplot(data=df, x='id', y='amount')"
+
+    @property
+    def total_rows(self) -> int:
+        return self.rows * len(self.table_names)
@@ -1,27 +1,25 @@
 import streamlit as st
-import json
-import pandas as pd
-from typing import List, Dict
-import io
-import zipfile
-import logging
-
-from services.data_generation_service import generate_data_with_gemini, build_edit_prompt, generate_data_from_prompt, validate_generated_data
-from services.postgres_service import execute_ddl_and_save_data
-from services.validation_service import validate_prompt, extract_affected_tables
-from langfuse.decorators import observe
+from typing import List
+
+import services.data_jobs  # noqa: F401 registers the job types
+from services.job_queue import submit, get_job, cancel, FINISHED
+from services.schema_registry import session_schema
+from services.dataset_store import Dataset, load_dataset
+from preview import get_preview, show_preview
 from dotenv import load_dotenv
 load_dotenv()
 
 
 def show_data_generation():
+    restore_job()
+    busy = job_running()
     with st.container(border=True):
         prompt = st.text_area("Prompt", placeholder="Enter your prompt here...")
 
         ddl_file = st.file_uploader("Upload your DDL schema", type=["sql", "ddl", "txt"])
         if ddl_file:
-            ddl_content = ddl_file.read().decode("utf-8")
-            st.session_state.ddl_schema = ddl_content  
+            st.session_state.ddl_schema = ddl_file.read().decode("utf-8")
+        ddl_content = st.session_state.get("ddl_schema")
 
         st.markdown("**Advanced Parameters**")
         col1, col2 = st.columns(2)
@@ -30,103 +28,138 @@ def show_data_generation():
         with col2:
             max_tokens = st.number_input("Max Tokens", min_value=1, max_value=4096, value=1000)
 
-        generate_button = st.button("Generate")
+        generate_button = st.button("Generate", disabled=busy)
 
     if generate_button:
-        validation = validate_prompt(prompt, ddl_content)
-        if validation != "OK":
-            st.error(f"Prompt rejected!")
+        if ddl_content is None:
+            st.error("Please upload a DDL file!")
         else:
-            if ddl_content is None:
-                st.error("Please upload a DDL file!")
-                return
-
-            with st.spinner("Generating data..."):
-                logging.info("Generating data...")
-                generated_data = generate_data_with_gemini(ddl_content, prompt, temperature)
-                checked_data = validate_generated_data(ddl_content, generated_data)
-                logging.info(f"Validation result: {checked_data}")
-                parsed_data = parse_json_block(generated_data)
-
-            if parsed_data:
-                st.session_state['generated_data'] = parsed_data
-                st.session_state['edit_prompts'] = []
-            else:
-                st.error("Failed to parse generated data!")
+            start_job("generate", {"ddl": ddl_content, "prompt": prompt, "temperature": temperature})
 
+    if job_running():
+        show_job_status()
+    elif st.session_state.get("job_outcome"):
+        level, message = st.session_state["job_outcome"]
+        getattr(st, level)(message)
 
     with st.container(border=True):
         if 'generated_data' in st.session_state:
             show_tables(st.session_state['generated_data'])
 
-            col1, col2 = st.columns([5, 1])
+            dataset = st.session_state['generated_data']
+            edit_prompts = st.session_state.get('edit_prompts', [])
+            col1, col2, col3 = st.columns([5, 1, 1])
             with col1:
                 edit_prompt = st.text_input("edit_prompt", placeholder="Enter quick edit instructions...", label_visibility="collapsed")
             with col2:
-                if st.button("Submit", use_container_width=True) and edit_prompt.strip():
-                    validation = validate_prompt(edit_prompt, ddl_content)
-                    if validation != "OK":
-                        st.error(f"Prompt rejected!")
-                    else:
-                        with st.spinner("Applying edit..."):
-                            process_edit_prompt(edit_prompt, temperature, ddl_content)
-            if st.button("Save locally"):
-                try:
-                    execute_ddl_and_save_data(ddl_content, st.session_state['generated_data'])
-
-                except Exception as e:
-                    st.error(f"Error data saving: {e}")
-
-def show_tables(data: List[Dict]):
-    col1, col2 = st.columns(2)
-    with col1:
-        st.write("Data Preview")
-    with col2:
-        table_names = [table['table_name'] for table in data]
-        selected_table = st.selectbox("Select table", table_names, label_visibility="collapsed")
-
-    for table_data in data:
-        if table_data['table_name'] == selected_table:
-            df = pd.DataFrame(table_data['rows'])
-            st.dataframe(df, use_container_width=True, hide_index=True)
-            break
-
-def process_edit_prompt(edit_prompt: str, temperature: float, ddl_schema: str):
-    full_data = st.session_state['generated_data']
-    edit_history = st.session_state.get('edit_prompts', [])
-
-    all_table_names = [table["table_name"] for table in full_data]
-    affected_tables = extract_affected_tables(edit_prompt, all_table_names)
-    filtered_data = [table for table in full_data if table["table_name"] in affected_tables]
-    full_prompt = build_edit_prompt(filtered_data, edit_history, edit_prompt, ddl_schema)
-
-    updated_data_str = generate_data_from_prompt(full_prompt, temperature)
-
-    parsed_data = parse_json_block(updated_data_str)
-
-    if parsed_data:
-        updated_table_names = {table['table_name'] for table in parsed_data}
-        for i, table in enumerate(full_data):
-            if table['table_name'] in updated_table_names:
-                full_data[i] = next(t for t in parsed_data if t['table_name'] == table['table_name'])
-
-        st.session_state['generated_data'] = full_data
-        st.session_state['edit_prompts'].append(edit_prompt)
-    else:
-        st.error("Failed to parse updated data.")
-
-
-def parse_json_block(raw: str):
+                if st.button("Submit", use_container_width=True, disabled=busy) and edit_prompt.strip():
+                    start_job("edit", {
+                        "ddl": ddl_content,
+                        "dataset": dataset.save(),
+                        "edit_prompts": edit_prompts,
+                        "edit_prompt": edit_prompt,
+                        "temperature": temperature
+                    })
+            with col3:
+                if st.button("Undo edit", use_container_width=True, disabled=busy or dataset.parent is None or not edit_prompts):
+                    set_generated_data(dataset.parent, edit_prompts[:-1])
+                    st.rerun()
+            if st.button("Save locally", disabled=busy):
+                start_job("save", {"ddl": ddl_content, "dataset": dataset.save(), "edit_prompts": edit_prompts})
+
+def start_job(kind: str, params: dict):
+    params["schema_name"] = session_schema(st.session_state)
+    job_id = submit(kind, params)
+    st.session_state["job_id"] = job_id
+    st.session_state.pop("job_outcome", None)
+    # The job id in the URL lets a refreshed page pick the job up again.
+    st.query_params["job"] = job_id
+    st.rerun()
+
+def job_running() -> bool:
+    job_id = st.session_state.get("job_id")
+    return job_id is not None and st.session_state.get("applied_job") != job_id
+
+def restore_job():
+    job_id = st.query_params.get("job")
+    if not job_id or st.session_state.get("job_id") == job_id:
+        return
+    job = get_job(job_id)
+    if job is None:
+        del st.query_params["job"]
+        return
+    params = job["params"]
+    dataset = None
+    if "dataset" in params:
+        dataset = load_expiring_dataset(params["dataset"])
+        if dataset is None:
+            return
+    st.session_state["job_id"] = job_id
+    if st.session_state.get("schema_name") != params["schema_name"]:
+        st.session_state.pop("data_saved", None)
+    st.session_state["schema_name"] = params["schema_name"]
+    st.session_state.ddl_schema = params["ddl"]
+    if dataset is not None:
+        set_generated_data(dataset, params["edit_prompts"])
+
+def load_expiring_dataset(path: str) -> Dataset | None:
+    # Datasets are removed after DATASET_TTL_HOURS while their jobs stay
+    # listed, so an old ?job= link can point at files that are gone.
     try:
-        if raw.startswith("```json"):
-            raw = raw[len("```json"):].strip()
-        if raw.endswith("```"):
-            raw = raw[:-3].strip()
-        return json.loads(raw)
-    except Exception as e:
-        st.error(f"JSON parsing error: {e}")
+        return load_dataset(path)
+    except FileNotFoundError:
+        if "job" in st.query_params:
+            del st.query_params["job"]
+        st.session_state["job_outcome"] = ("warning", "Job results expired.")
         return None
 
+@st.fragment(run_every=1)
+def show_job_status():
+    job_id = st.session_state["job_id"]
+    job = get_job(job_id)
+    if job is None or job["status"] in FINISHED:
+        apply_job(job_id, job)
+        st.rerun()
+
+    col1, col2 = st.columns([5, 1])
+    with col1:
+        st.progress(job["progress"], text=job["message"] or "Queued...")
+    with col2:
+        st.button("Cancel", on_click=cancel, args=(job_id,), disabled=bool(job["cancel_requested"]), use_container_width=True)
+
+def apply_job(job_id: str, job: dict | None):
+    st.session_state["applied_job"] = job_id
+    if job is None:
+        st.session_state["job_outcome"] = ("error", "The background job was lost.")
+    elif job["status"] == "succeeded":
+        result = job["result"]
+        st.session_state["job_outcome"] = ("success", result["message"]) if "message" in result else None
+        if "dataset" in result:
+            dataset = load_expiring_dataset(result["dataset"])
+            if dataset is not None:
+                set_generated_data(dataset, result["edit_prompts"])
+        if job["kind"] == "save":
+            st.session_state["data_saved"] = True
+    elif job["status"] == "cancelled":
+        st.session_state["job_outcome"] = ("info", "Cancelled.")
+    elif job["kind"] == "save":
+        st.session_state["job_outcome"] = ("error", f"Error data saving: {job['error']}")
+    else:
+        st.session_state["job_outcome"] = ("error", job["error"])
 
+def set_generated_data(dataset: Dataset, edit_prompts: List[str]):
+    st.session_state['generated_data'] = dataset
+    st.session_state['edit_prompts'] = edit_prompts
 
+def show_tables(dataset: Dataset):
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("Data Preview")
+    with col2:
+        selected_table = st.selectbox("Select table", dataset.table_names, label_visibility="collapsed")
 
+    if selected_table in dataset:
+        # Previews are keyed by the version the table last changed in, so
+        # tables an edit did not touch keep their cached preview.
+        preview = get_preview(dataset.table_key(selected_table), lambda: dataset.table(selected_table))
+        show_preview(preview, key=f"data_{selected_table}", show_stats=True)
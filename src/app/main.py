@@ -5,7 +5,6 @@ import logging
 import streamlit as st
 from data_generation import show_data_generation
 from talk_to_data import show_talk_to_data
-from langfuse.decorators import observe
 from dotenv import load_dotenv
 import atexit
 load_dotenv()
@@ -0,0 +1,31 @@
+import streamlit as st
+from typing import Callable, Hashable
+
+import pyarrow as pa
+
+from services.preview_cache import PreviewCache, TablePreview
+
+PAGE_SIZE = 100
+
+
+def get_preview(key: Hashable, build: Callable[[], pa.Table]) -> TablePreview:
+    if "preview_cache" not in st.session_state:
+        st.session_state.preview_cache = PreviewCache()
+    return st.session_state.preview_cache.get(key, build)
+
+
+def show_preview(preview: TablePreview, key: str, use_container_width: bool = True, show_stats: bool = False):
+    page = 0
+    pages = preview.page_count(PAGE_SIZE)
+    if pages > 1:
+        col1, col2 = st.columns([1, 4])
+        with col1:
+            page = st.number_input("Page", min_value=1, max_value=pages, value=1, key=f"{key}_page", label_visibility="collapsed") - 1
+        with col2:
+            start = page * PAGE_SIZE
+            st.caption(f"Rows {start + 1}-{min(start + PAGE_SIZE, preview.num_rows)} of {preview.num_rows} (page {page + 1} of {pages})")
+    st.dataframe(preview.page(page, PAGE_SIZE), use_container_width=use_container_width, hide_index=True)
+
+    if show_stats:
+        with st.expander("Column stats"):
+            st.dataframe(preview.stats(), use_container_width=True, hide_index=True)
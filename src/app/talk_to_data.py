@@ -1,25 +1,48 @@
 import streamlit as st
 import logging
+import altair as alt
+import pandas as pd
 from services.chat_service import chat_response
 from services.validation_service import validate_prompt
-import base64
-import pickle
+from services.metrics import start_turn
+from services.schema_registry import session_schema
+from services.dataset_store import frame_to_table
+from preview import get_preview, show_preview
 
 
 def show_talk_to_data():
     if "ddl_schema" not in st.session_state:
         st.warning("Please upload a DDL schema first in the data generation section")
         return
+    if not st.session_state.get("data_saved"):
+        st.warning("Please save the generated data first in the data generation section")
+        return
     
     ddl_schema = st.session_state.ddl_schema
-    chat_container(ddl_schema)
+    show_debug = st.sidebar.toggle("Debug timings", value=False)
+    chat_container(ddl_schema, show_debug)
 
 
-def chat_container(ddl_schema: str):
+def show_waterfall(timings: list[dict]):
+    if not timings:
+        return
+    df = pd.DataFrame(timings)
+    chart = alt.Chart(df).mark_bar().encode(
+        x=alt.X("start_ms:Q", title="ms since turn start"),
+        x2="end_ms:Q",
+        y=alt.Y("stage:N", sort=None, title=None),
+        color=alt.Color("stage:N", legend=None),
+        tooltip=["stage", "duration_ms", "tokens", "retries", "rows", "error"]
+    ).properties(height=30 * len(df) + 20)
+    with st.expander(f"Timings ({df['end_ms'].max():.0f} ms)"):
+        st.altair_chart(chart, use_container_width=True)
+
+
+def chat_container(ddl_schema: str, show_debug: bool = False):
     if "messages" not in st.session_state:
         st.session_state.messages = []
 
-    for message in st.session_state.messages:
+    for i, message in enumerate(st.session_state.messages):
         with st.chat_message(message["role"]):
             if message["role"] == "user":
                 st.markdown(message["content"])
@@ -28,11 +51,11 @@ def chat_container(ddl_schema: str):
                     st.code(message["sql"], language="sql")
 
                 if "df" in message:
-                    try:
-                        df = pickle.loads(base64.b64decode(message["df"]))
-                        st.dataframe(df, use_container_width=False)
-                    except Exception as e:
-                        st.warning(f"Could not load previous DataFrame: {e}")
+                    preview = get_preview(("chat", i), lambda: message["df"])
+                    show_preview(preview, key=f"chat_{i}", use_container_width=False)
+
+                if "warning" in message:
+                    st.warning(message["warning"])
 
                 if "plot_image" in message:
                     st.image(message["plot_image"])
@@ -40,6 +63,9 @@ def chat_container(ddl_schema: str):
                 if "error" in message:
                     st.error(message["error"])
 
+                if show_debug and "timings" in message:
+                    show_waterfall(message["timings"])
+
 
     if prompt := st.chat_input("Ask a question about your data?"):
         
@@ -47,47 +73,61 @@ def chat_container(ddl_schema: str):
             st.markdown(prompt)
         st.session_state.messages.append({"role": "user", "content": prompt})
 
-        try:
-            validation = validate_prompt(prompt, ddl_schema)
-            if validation != "OK":
-                assistant_msg = {
-                    "role": "assistant",
-                    "error": "Your question was rejected. Please make sure it is clear and relevant."
-                }
+        with start_turn() as turn:
+            try:
+                validation = validate_prompt(prompt, ddl_schema)
+                if validation != "OK":
+                    assistant_msg = {
+                        "role": "assistant",
+                        "error": "Your question was rejected. Please make sure it is clear and relevant."
+                    }
 
-                with st.chat_message("assistant"):
-                    st.error(assistant_msg["error"])
+                    with st.chat_message("assistant"):
+                        st.error(assistant_msg["error"])
 
-                st.session_state.messages.append(assistant_msg)
+                    st.session_state.messages.append(assistant_msg)
+
+                else:
+                    response = chat_response(ddl_schema, prompt, st.session_state.messages, session_schema(st.session_state))
 
-            else:
-                response = chat_response(ddl_schema, prompt, st.session_state.messages)
+                    with st.chat_message("assistant"):
+                        assistant_msg = {"role": "assistant"}
 
-                with st.chat_message("assistant"):
-                    assistant_msg = {"role": "assistant"}
+                        if isinstance(response, tuple) and len(response) == 2:
+                            sql_query, df = response
 
-                    if isinstance(response, tuple) and len(response) == 2:
-                        sql_query, df = response
+                            st.code(sql_query, language="sql")
+                            assistant_msg["sql"] = sql_query
 
-                        st.code(sql_query, language="sql")
-                        assistant_msg["sql"] = sql_query
+                            if not df.empty:
+                                # Results are kept as Arrow tables; pages are sliced from them on rerender.
+                                assistant_msg["df"] = frame_to_table(df)
+                                preview = get_preview(("chat", len(st.session_state.messages)), lambda: assistant_msg["df"])
+                                show_preview(preview, key=f"chat_{len(st.session_state.messages)}", use_container_width=False)
+                                if df.attrs.get("truncated_at"):
+                                    assistant_msg["warning"] = (
+                                        f"The query returned more than {df.attrs['truncated_at']:,} rows; only the first "
+                                        f"{df.attrs['truncated_at']:,} are shown. Add filters or aggregation, or an explicit LIMIT."
+                                    )
+                                    st.warning(assistant_msg["warning"])
 
-                        if not df.empty:
-                            st.dataframe(df, use_container_width=False)
-                            df = base64.b64encode(pickle.dumps(df)).decode("utf-8")
-                            assistant_msg["df"] = df
+                            else:
+                                st.warning("Query returned no results.")
 
                         else:
-                            st.warning("Query returned no results.")
+                            image, plot_code, error = response
+                            st.image(image)
+                            assistant_msg["plot_image"] = image
+                            assistant_msg["plot_code"] = plot_code
 
-                    else:
-                        image, plot_code, error = response
-                        st.image(image)
-                        assistant_msg["plot_image"] = image
-                        assistant_msg["plot_code"] = plot_code
+                        st.session_state.messages.append(assistant_msg)
 
-                    st.session_state.messages.append(assistant_msg)
+            except Exception as e:
+                st.error(f"Error: {e}")
 
-        except Exception as e:
-            st.error(f"Error: {e}")
+        last_msg = st.session_state.messages[-1]
+        if last_msg["role"] == "assistant":
+            last_msg["timings"] = turn.waterfall()
+            if show_debug:
+                show_waterfall(last_msg["timings"])
 
@@ -0,0 +1,445 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Dict, List
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MIN_HITS = int(os.getenv("AGGREGATE_MIN_HITS", "3"))
+MAX_SUMMARIES = int(os.getenv("AGGREGATE_MAX_SUMMARIES", "10"))
+MIN_SOURCE_ROWS = int(os.getenv("AGGREGATE_MIN_SOURCE_ROWS", "10000"))
+MAX_SUMMARY_RATIO = float(os.getenv("AGGREGATE_MAX_RATIO", "0.5"))
+VIEW_PREFIX = "_agg_"
+DIALECT = "postgres"
+FLOAT_TYPES = {"real", "double precision"}
+RECORD_QUEUE_SIZE = 1000
+
+_registry_ready = False
+_registry_lock = threading.Lock()
+_pending: queue.Queue = queue.Queue(maxsize=RECORD_QUEUE_SIZE)
+_recorder: threading.Thread | None = None
+_recorder_lock = threading.Lock()
+
+
+class NotCovered(Exception):
+    pass
+
+
+@dataclass
+class Pattern:
+    tree: exp.Select
+    source: str
+    tables: List[str]
+    group_keys: List[exp.Expression]
+    keys: List[str]
+    parts: List[str]
+
+    @property
+    def fingerprint(self) -> str:
+        payload = json.dumps({"source": self.source, "keys": self.keys}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Summary:
+    view: str
+    keys: List[str]
+    parts: List[str]
+    types: Dict[str, str]
+
+
+def view_name_for(fingerprint: str) -> str:
+    return VIEW_PREFIX + fingerprint[:16]
+
+
+def sql_of(node: exp.Expression) -> str:
+    return node.sql(dialect=DIALECT)
+
+
+def parts_of(node: exp.AggFunc) -> List[str]:
+    if isinstance(node, exp.Count):
+        return [sql_of(node)]
+    if isinstance(node, (exp.Sum, exp.Min, exp.Max)):
+        return [sql_of(node)]
+    if isinstance(node, exp.Avg):
+        return [sql_of(exp.Sum(this=node.this.copy())), sql_of(exp.Count(this=node.this.copy()))]
+    raise NotCovered(f"{node.key.upper()} cannot be re-aggregated")
+
+
+def resolve_group_key(node: exp.Expression, select: List[exp.Expression]) -> exp.Expression:
+    if isinstance(node, exp.Literal) and node.is_int:
+        return select[int(node.this) - 1].unalias()
+    if isinstance(node, exp.Column) and not node.table:
+        for item in select:
+            if isinstance(item, exp.Alias) and item.alias == node.name:
+                target = item.this
+                # Postgres resolves an ambiguous GROUP BY name to the input
+                # column, so an alias shadowing one of its own inputs is skipped.
+                if not isinstance(target, exp.Column) and any(c.name == node.name for c in target.find_all(exp.Column)):
+                    raise NotCovered(f"GROUP BY {node.name} is ambiguous")
+                return target
+    return node
+
+
+def analyze(query: str) -> Pattern | None:
+    try:
+        tree = sqlglot.parse_one(query, read=DIALECT)
+        if not isinstance(tree, exp.Select) or tree.args.get("with") or tree.args.get("distinct"):
+            return None
+        if tree.find(exp.Window, exp.Filter) or any(node is not tree for node in tree.find_all(exp.Select)):
+            return None
+        group = tree.args.get("group")
+        if not group or not group.expressions or any(group.args.get(k) for k in ("rollup", "cube", "grouping_sets")):
+            return None
+
+        sources = [tree.args["from"].this] + [join.this for join in tree.args.get("joins") or []]
+        if not all(isinstance(s, exp.Table) and not s.args.get("db") for s in sources):
+            return None
+        source = " ".join([sql_of(tree.args["from"])] + [sql_of(join) for join in tree.args.get("joins") or []])
+
+        group_keys = [resolve_group_key(node, tree.expressions) for node in group.expressions]
+        if any(key.find(exp.AggFunc) for key in group_keys):
+            return None
+        keys = {sql_of(key) for key in group_keys}
+        if tree.args.get("where"):
+            keys.update(sql_of(column) for column in tree.args["where"].find_all(exp.Column))
+
+        parts = set()
+        for node in tree.find_all(exp.AggFunc):
+            if node.find(exp.Distinct):
+                return None
+            parts.update(parts_of(node))
+    except (SqlglotError, NotCovered, IndexError, ValueError, KeyError) as e:
+        logging.debug(f"Query is not a summary candidate: {e}")
+        return None
+
+    pattern = Pattern(tree, source, [s.name for s in sources], group_keys, sorted(keys), sorted(parts))
+    if rewrite(pattern, Summary("candidate", pattern.keys, pattern.parts, {}), None, "") is None:
+        return None
+    return pattern
+
+
+def combine(node: exp.AggFunc, part_columns: Dict[str, str], types: Dict[str, str]) -> exp.Expression:
+    def column(part_sql: str) -> str:
+        if part_sql not in part_columns:
+            raise NotCovered(f"{part_sql} is not in the summary")
+        return part_columns[part_sql]
+
+    if isinstance(node, exp.Count):
+        combined = f"CAST(SUM({column(sql_of(node))}) AS BIGINT)"
+    elif isinstance(node, exp.Sum):
+        name = column(sql_of(node))
+        combined = f"CAST(SUM({name}) AS {types[name]})" if name in types else f"SUM({name})"
+    elif isinstance(node, exp.Min):
+        combined = f"MIN({column(sql_of(node))})"
+    elif isinstance(node, exp.Max):
+        combined = f"MAX({column(sql_of(node))})"
+    else:
+        total, count = (column(part) for part in parts_of(node))
+        cast = "DOUBLE PRECISION" if types.get(total) in FLOAT_TYPES else "NUMERIC"
+        combined = f"CAST(SUM({total}) AS {cast}) / NULLIF(SUM({count}), 0)"
+    return exp.paren(sqlglot.parse_one(combined, read=DIALECT), copy=False)
+
+
+def default_name(item: exp.Expression) -> str:
+    # Approximates the column name Postgres gives an unaliased select item;
+    # real names are read from the database before a query is rewritten.
+    if isinstance(item, (exp.Alias, exp.Column)):
+        return item.alias_or_name
+    if isinstance(item, exp.Anonymous):
+        return item.name.lower()
+    return item.key
+
+
+def rewrite(pattern: Pattern, summary: Summary, output_names: List[str] | None, schema_name: str) -> str | None:
+    key_columns = {key: f"k{i}" for i, key in enumerate(summary.keys)}
+    part_columns = {part: f"p{i}" for i, part in enumerate(summary.parts)}
+
+    def replace(node):
+        if isinstance(node, exp.AggFunc):
+            return combine(node, part_columns, summary.types)
+        name = key_columns.get(sql_of(node))
+        return exp.column(name) if name else node
+
+    tree = pattern.tree
+    aliases = set(output_names or [default_name(item) for item in tree.expressions])
+    try:
+        select = []
+        for i, item in enumerate(tree.expressions):
+            replaced = item.unalias().transform(replace)
+            name = output_names[i] if output_names else default_name(item)
+            select.append(exp.alias_(replaced, name, quoted=True))
+        group_by = [exp.column(key_columns[sql_of(key)]) for key in pattern.group_keys]
+    except (NotCovered, KeyError):
+        return None
+
+    rewritten = exp.select(*select).from_(exp.table_(summary.view, db=schema_name or None, quoted=True))
+    try:
+        if tree.args.get("where"):
+            rewritten = rewritten.where(tree.args["where"].this.transform(replace))
+        rewritten = rewritten.group_by(*group_by)
+        if tree.args.get("having"):
+            rewritten = rewritten.having(tree.args["having"].this.transform(replace))
+        if tree.args.get("order"):
+            rewritten.set("order", tree.args["order"].transform(replace))
+    except NotCovered:
+        return None
+    for arg in ("limit", "offset"):
+        if tree.args.get(arg):
+            rewritten.set(arg, tree.args[arg].copy())
+
+    summary_columns = set(key_columns.values()) | set(part_columns.values())
+    order = rewritten.args.get("order")
+    for column in rewritten.find_all(exp.Column):
+        if column.table or column.name not in summary_columns:
+            if not (order and column.find_ancestor(exp.Order) is order and column.name in aliases and not column.table):
+                return None
+    return sql_of(rewritten)
+
+
+def ensure_summary_registry(conn):
+    # Created once per process in its own short transaction; afterwards
+    # ON CONFLICT and FOR UPDATE serialize writers per pattern row.
+    global _registry_ready
+    with _registry_lock:
+        if _registry_ready:
+            return
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext('aggregate_patterns'))")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS public.aggregate_patterns (
+                    schema_name TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    tables JSONB NOT NULL,
+                    keys JSONB NOT NULL,
+                    parts JSONB NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    view_parts JSONB,
+                    last_used_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    PRIMARY KEY (schema_name, fingerprint)
+                )
+            """)
+        conn.commit()
+        _registry_ready = True
+
+
+def record_query(query: str, schema_name: str):
+    # Runs after every successful chat query, so parsing and the upsert are
+    # left to a background thread and the answer is never held up.
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = threading.Thread(target=run_recorder, name="summary-recorder", daemon=True)
+            _recorder.start()
+    try:
+        _pending.put_nowait((query, schema_name))
+    except queue.Full:
+        logging.debug("Query pattern queue is full, pattern not recorded")
+
+
+def run_recorder():
+    from services.postgres_service import get_connection
+
+    conn = None
+    while True:
+        query, schema_name = _pending.get()
+        pattern = analyze(query)
+        if pattern is None:
+            continue
+        try:
+            if conn is None or conn.closed:
+                conn = get_connection()
+                ensure_summary_registry(conn)
+            store_pattern(conn, pattern, schema_name)
+        except Exception as e:
+            logging.warning(f"Could not record query pattern for {schema_name}: {e}")
+            if conn is not None:
+                conn.close()
+            conn = None
+
+
+def store_pattern(conn, pattern: Pattern, schema_name: str):
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO public.aggregate_patterns (schema_name, fingerprint, source, tables, keys, parts)
+                VALUES (%s, %s, %s, %s, %s, '[]')
+                ON CONFLICT (schema_name, fingerprint) DO NOTHING
+            """, (schema_name, pattern.fingerprint, pattern.source, json.dumps(pattern.tables), json.dumps(pattern.keys)))
+            cursor.execute("""
+                SELECT parts, hits, status, view_parts FROM public.aggregate_patterns
+                WHERE schema_name = %s AND fingerprint = %s FOR UPDATE
+            """, (schema_name, pattern.fingerprint))
+            parts, hits, status, view_parts = cursor.fetchone()
+            parts = sorted(set(parts) | set(pattern.parts))
+            cursor.execute("""
+                UPDATE public.aggregate_patterns SET parts = %s, hits = hits + 1, last_used_at = now()
+                WHERE schema_name = %s AND fingerprint = %s
+            """, (json.dumps(parts), schema_name, pattern.fingerprint))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    stale = status == "pending" or (status == "ready" and not set(parts) <= set(view_parts or []))
+    if hits + 1 >= MIN_HITS and stale:
+        threading.Thread(
+            target=materialize_async, args=(schema_name, pattern.fingerprint), name=f"summary-{schema_name}", daemon=True
+        ).start()
+
+
+def remove_patterns(conn, schema_name: str):
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM public.aggregate_patterns WHERE schema_name = %s", (schema_name,))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logging.warning(f"Could not remove query patterns of {schema_name}: {e}")
+
+
+def materialize_async(schema_name: str, fingerprint: str):
+    from services.postgres_service import get_connection
+    from services.schema_registry import lock_schema
+
+    conn = None
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            lock_schema(cursor, schema_name)
+            cursor.execute(f'SET LOCAL search_path TO "{schema_name}"')
+            for row in eligible_patterns(cursor, schema_name):
+                if row[0] == fingerprint:
+                    materialize(cursor, schema_name, *row)
+        conn.commit()
+    except Exception as e:
+        logging.warning(f"Could not build summary for {schema_name}: {e}")
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def eligible_patterns(cursor, schema_name: str) -> list:
+    cursor.execute("""
+        SELECT fingerprint, source, tables, keys, parts, status, view_parts
+        FROM public.aggregate_patterns
+        WHERE schema_name = %s AND hits >= %s
+        ORDER BY hits DESC, last_used_at DESC
+        LIMIT %s
+    """, (schema_name, MIN_HITS, MAX_SUMMARIES))
+    return cursor.fetchall()
+
+
+def materialize(cursor, schema_name: str, fingerprint: str, source: str, tables: list, keys: list, parts: list,
+                status: str = None, view_parts: list = None):
+    view = view_name_for(fingerprint)
+    columns = [f"{key} AS k{i}" for i, key in enumerate(keys)] + [f"{part} AS p{i}" for i, part in enumerate(parts)]
+    cursor.execute("SAVEPOINT summary")
+    try:
+        cursor.execute(f'DROP MATERIALIZED VIEW IF EXISTS "{view}"')
+        cursor.execute(f"SELECT count(*) {source}")
+        source_rows = cursor.fetchone()[0]
+        if source_rows < MIN_SOURCE_ROWS:
+            new_status = "rejected"
+        else:
+            cursor.execute(
+                f'CREATE MATERIALIZED VIEW "{view}" AS SELECT {", ".join(columns)} {source} GROUP BY {", ".join(keys)}'
+            )
+            cursor.execute(f'SELECT count(*) FROM "{view}"')
+            summary_rows = cursor.fetchone()[0]
+            new_status = "ready" if summary_rows <= source_rows * MAX_SUMMARY_RATIO else "rejected"
+            if new_status == "rejected":
+                cursor.execute(f'DROP MATERIALIZED VIEW "{view}"')
+        cursor.execute("RELEASE SAVEPOINT summary")
+    except Exception as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT summary")
+        logging.warning(f"Could not materialize summary {view} in {schema_name}: {e}")
+        new_status = "rejected"
+    cursor.execute("""
+        UPDATE public.aggregate_patterns SET status = %s, view_parts = %s
+        WHERE schema_name = %s AND fingerprint = %s
+    """, (new_status, json.dumps(parts) if new_status == "ready" else None, schema_name, fingerprint))
+    logging.info(f"Summary {view} for {schema_name}: {new_status}")
+
+
+def drop_summaries(cursor, schema_name: str):
+    cursor.execute(
+        "SELECT matviewname FROM pg_matviews WHERE schemaname = %s AND starts_with(matviewname, %s)",
+        (schema_name, VIEW_PREFIX)
+    )
+    for view, in cursor.fetchall():
+        cursor.execute(f'DROP MATERIALIZED VIEW "{schema_name}"."{view}"')
+
+
+def refresh_summaries(cursor, schema_name: str, changed_tables: set | None):
+    cursor.execute(f'SET LOCAL search_path TO "{schema_name}"')
+    cursor.execute(
+        "SELECT matviewname FROM pg_matviews WHERE schemaname = %s AND starts_with(matviewname, %s)",
+        (schema_name, VIEW_PREFIX)
+    )
+    existing = {view for view, in cursor.fetchall()}
+    for fingerprint, source, tables, keys, parts, status, view_parts in eligible_patterns(cursor, schema_name):
+        # None means the schema was rebuilt or altered and every summary is re-evaluated.
+        if changed_tables is not None and not changed_tables.intersection(tables):
+            continue
+        if view_name_for(fingerprint) in existing and set(parts) <= set(view_parts or []):
+            cursor.execute(f'REFRESH MATERIALIZED VIEW "{view_name_for(fingerprint)}"')
+        else:
+            materialize(cursor, schema_name, fingerprint, source, tables, keys, parts)
+
+
+def find_summary(conn, pattern: Pattern, schema_name: str) -> Summary | None:
+    global _registry_ready
+    if not _registry_ready:
+        if conn.exec_driver_sql("SELECT to_regclass('public.aggregate_patterns')").scalar() is None:
+            return None
+        _registry_ready = True
+
+    rows = conn.exec_driver_sql("""
+        SELECT p.fingerprint, p.keys, p.view_parts
+        FROM public.aggregate_patterns p
+        JOIN pg_matviews v ON v.schemaname = p.schema_name AND v.matviewname = %(prefix)s || left(p.fingerprint, 16)
+        WHERE p.schema_name = %(schema)s AND p.source = %(source)s AND p.status = 'ready' AND v.ispopulated
+    """, {"prefix": VIEW_PREFIX, "schema": schema_name, "source": pattern.source}).fetchall()
+    candidates = [
+        (keys, view_parts, fingerprint) for fingerprint, keys, view_parts in rows
+        if set(pattern.keys) <= set(keys) and set(pattern.parts) <= set(view_parts)
+    ]
+    if not candidates:
+        return None
+    keys, parts, fingerprint = min(candidates, key=lambda c: len(c[0]))
+    view = view_name_for(fingerprint)
+    types = dict(conn.exec_driver_sql("""
+        SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = to_regclass(%(view)s) AND attnum > 0 AND NOT attisdropped
+    """, {"view": f'"{schema_name}"."{view}"'}).fetchall())
+    return Summary(view, keys, parts, types)
+
+
+def match_summary(conn, query: str, schema_name: str) -> tuple[Pattern, Summary] | None:
+    pattern = analyze(query)
+    if pattern is None:
+        return None
+    summary = find_summary(conn, pattern, schema_name)
+    if summary is None:
+        return None
+    return pattern, summary
+
+
+def rewrite_query(conn, query: str, match: tuple[Pattern, Summary], schema_name: str) -> str | None:
+    pattern, summary = match
+    # Output names come from Postgres itself so the summary answer has the
+    # same columns as the original, including unaliased ones like "count".
+    output_names = list(conn.exec_driver_sql(f"SELECT * FROM ({query.replace('%', '%%')}) AS q LIMIT 0").keys())
+    return rewrite(pattern, summary, output_names, schema_name)
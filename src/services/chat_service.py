@@ -1,14 +1,13 @@
-from services.gemini_client import client
+from services.gemini_client import generate_content
 from services.sql_generation_service import sql_generation, sql_generation_declaration
 from services.plot_generation_service import plot_generator, plot_generation_declaration
+from services.metrics import stage
 from google.genai import types
 
-from langfuse.decorators import observe, langfuse_context
 from dotenv import load_dotenv
 load_dotenv()
 
-@observe()
-def chat_response(ddl_schema: str, user_query: str, messages: str):
+def chat_response(ddl_schema: str, user_query: str, messages: str, schema_name: str):
     tools = types.Tool(function_declarations=[sql_generation_declaration, plot_generation_declaration])
     config = types.GenerateContentConfig(
         temperature=0.0,
@@ -28,9 +27,11 @@ def chat_response(ddl_schema: str, user_query: str, messages: str):
         )
     ]
     model = "gemini-2.0-flash"
-    response = client.models.generate_content(
-        model=model, config=config, contents=contents
-    )
+    with stage("route"):
+        response = generate_content(
+            "chat_response",
+            model=model, config=config, contents=contents
+        )
 
     tool_call = response.candidates[0].content.parts[0].function_call
     if tool_call is None:
@@ -40,7 +41,7 @@ def chat_response(ddl_schema: str, user_query: str, messages: str):
     args = tool_call.args
 
     if name == "sql_generation":
-        return sql_generation(ddl_schema, user_query, messages)
+        return sql_generation(ddl_schema, user_query, messages, schema_name)
     elif name == "plot_generator":
-        return plot_generator(user_query, ddl_schema, messages)
+        return plot_generator(user_query, ddl_schema, messages, schema_name)
 
@@ -1,9 +1,9 @@
 from typing import List, Dict
 import json
-from services.gemini_client import client
-from langfuse.decorators import observe, langfuse_context
+from services.gemini_client import generate_content
+from services.validation_service import extract_affected_tables
+from services.dataset_store import Dataset, rows_to_table
 
-@observe(as_type="generation")
 def generate_data_with_gemini(ddl_schema: str, prompt: str, temperature: float) -> str:
     full_prompt = f"""
 You are a data generator. Given the following ddl schema, generate realistic and consistent sample data.
@@ -30,27 +30,18 @@ Additional context: {prompt}
 """
 
     model = "gemini-2.5-flash-preview-05-20"
-    response = client.models.generate_content(
-            model=model,
-            contents=full_prompt,
-            config={"temperature": temperature}
-        )
-    
-    langfuse_context.update_current_observation(
-    input=input,
-    model=model,
-    usage_details={
-          "input": response.usage_metadata.prompt_token_count,
-          "output": response.usage_metadata.candidates_token_count,
-          "total": response.usage_metadata.total_token_count
-      })
+    response = generate_content(
+        "generate_data_with_gemini",
+        model=model,
+        contents=full_prompt,
+        config={"temperature": temperature}
+    )
 
     output = response.text.strip()
 
     return output
 
 
-@observe(as_type="generation")
 def validate_generated_data(ddl_schema: str, generated_data: str):
     prompt = f"""
 You are a data validator. 
@@ -71,45 +62,30 @@ Data to validate:
 
 """
     model = "gemini-2.0-flash"
-    response = client.models.generate_content(
+    response = generate_content(
+        "validate_generated_data",
         model=model,
         contents=prompt,
         config={
             "temperature": 0.0
         }
     )
-    langfuse_context.update_current_observation(
-    input=input,
-    model=model,
-    usage_details={
-          "input": response.usage_metadata.prompt_token_count,
-          "output": response.usage_metadata.candidates_token_count,
-          "total": response.usage_metadata.total_token_count
-      })
 
     return response.text
 
-@observe(as_type="generation")
 def generate_data_from_prompt(prompt: str, temperature: float) -> str:
     model = "gemini-2.0-flash"
-    response = client.models.generate_content(
+    response = generate_content(
+        "generate_data_from_prompt",
         model=model,
         contents=prompt,
         config={"temperature": temperature}
     )
-    langfuse_context.update_current_observation(
-    input=input,
-    model=model,
-    usage_details={
-          "input": response.usage_metadata.prompt_token_count,
-          "output": response.usage_metadata.candidates_token_count,
-          "total": response.usage_metadata.total_token_count
-      })
     return response.text
 
 
 def build_edit_prompt(current_data: List[Dict], edit_history: List[str], new_instruction: str, ddl_schema: str) -> str:
-    json_data = json.dumps(current_data, indent=2)
+    json_data = json.dumps(current_data, indent=2, default=str)
     edit_steps = "\n".join([f"{i+1}. {edit}" for i, edit in enumerate(edit_history)])
     next_step = f"{len(edit_history) + 1}. {new_instruction}"
 
@@ -145,4 +121,31 @@ def build_edit_prompt(current_data: List[Dict], edit_history: List[str], new_ins
     - Analyze the instruction carefully and reason which tables are involved.
     - Maintain correct relationships (e.g. foreign keys, references).
     - Keep the table structure identical to the input.
-    """
\ No newline at end of file
+    """
+
+
+def apply_edit(dataset: Dataset, edit_history: List[str], edit_prompt: str, temperature: float, ddl_schema: str) -> Dataset:
+    affected_tables = extract_affected_tables(edit_prompt, dataset.table_names)
+    filtered_data = dataset.to_records(affected_tables)
+    full_prompt = build_edit_prompt(filtered_data, edit_history, edit_prompt, ddl_schema)
+
+    updated_data_str = generate_data_from_prompt(full_prompt, temperature)
+
+    parsed_data = parse_json_block(updated_data_str)
+    if not parsed_data:
+        raise ValueError("Failed to parse updated data.")
+
+    return dataset.with_tables({
+        table['table_name']: rows_to_table(table['rows']) for table in parsed_data if table['table_name'] in dataset
+    })
+
+
+def parse_json_block(raw: str):
+    if raw.startswith("```json"):
+        raw = raw[len("```json"):].strip()
+    if raw.endswith("```"):
+        raw = raw[:-3].strip()
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON parsing error: {e}") from e
@@ -0,0 +1,49 @@
+import logging
+
+from services.data_generation_service import generate_data_with_gemini, validate_generated_data, apply_edit, parse_json_block
+from services.dataset_store import Dataset, load_dataset
+from services.job_queue import JobContext, job
+from services.postgres_service import execute_ddl_and_save_data
+from services.validation_service import validate_prompt
+
+
+class PromptRejected(Exception):
+    pass
+
+
+def check_prompt(prompt: str, ddl_schema: str, context: JobContext):
+    context.progress(0.05, "Validating prompt")
+    if validate_prompt(prompt, ddl_schema) != "OK":
+        raise PromptRejected("Prompt rejected!")
+
+
+@job("generate")
+def generate_job(params: dict, context: JobContext) -> dict:
+    check_prompt(params["prompt"], params["ddl"], context)
+    context.progress(0.2, "Generating data")
+    generated_data = generate_data_with_gemini(params["ddl"], params["prompt"], params["temperature"])
+    context.progress(0.7, "Validating generated data")
+    checked_data = validate_generated_data(params["ddl"], generated_data)
+    logging.info(f"Validation result: {checked_data}")
+    context.progress(0.9, "Parsing generated data")
+    parsed_data = parse_json_block(generated_data)
+    if not parsed_data:
+        raise ValueError("Failed to parse generated data!")
+    return {"dataset": Dataset.from_records(parsed_data).save(), "edit_prompts": []}
+
+
+@job("edit")
+def edit_job(params: dict, context: JobContext) -> dict:
+    check_prompt(params["edit_prompt"], params["ddl"], context)
+    context.progress(0.2, "Applying edit")
+    dataset = apply_edit(
+        load_dataset(params["dataset"]), params["edit_prompts"], params["edit_prompt"], params["temperature"], params["ddl"]
+    )
+    context.check_cancelled()
+    return {"dataset": dataset.save(), "edit_prompts": params["edit_prompts"] + [params["edit_prompt"]]}
+
+
+@job("save")
+def save_job(params: dict, context: JobContext) -> dict:
+    message = execute_ddl_and_save_data(params["ddl"], load_dataset(params["dataset"]), params["schema_name"], context.progress)
+    return {"message": message}
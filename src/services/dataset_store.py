@@ -0,0 +1,212 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+import pandas as pd
+import pyarrow as pa
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATASET_DIR = os.getenv("DATASET_DIR", os.path.join(tempfile.gettempdir(), "data_assistant_datasets"))
+DATASET_TTL_HOURS = float(os.getenv("DATASET_TTL_HOURS", "24"))
+MAX_HISTORY = 10
+MAX_LOADED = 8
+MANIFEST = "manifest.v{version}.json"
+MANIFEST_NAME = re.compile(r"manifest\.v(\d+)\.json")
+
+_loaded: OrderedDict[str, "Dataset"] = OrderedDict()
+_loaded_lock = threading.Lock()
+_collected = False
+_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+
+
+def rows_to_table(rows: List[Dict]) -> pa.Table:
+    try:
+        return pa.Table.from_pylist(rows)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return frame_to_table(pd.DataFrame(rows))
+
+
+def frame_to_table(df: pd.DataFrame) -> pa.Table:
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    # Mixed value types in a column (e.g. "12" and 12) cannot be inferred,
+    # so only those columns fall back to strings.
+    columns = {}
+    for name in df.columns:
+        try:
+            columns[str(name)] = pa.array(df[name], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            columns[str(name)] = pa.array(df[name].astype("string"), from_pandas=True)
+    return pa.table(columns)
+
+
+def hash_table(table: pa.Table) -> str:
+    digest = hashlib.sha256()
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    digest.update(sink.getvalue())
+    return digest.hexdigest()
+
+
+# Datasets are immutable: an edit creates a new version sharing every unchanged
+# table with its parent, so the edit history only costs the changed tables.
+class Dataset:
+    def __init__(self, tables: Dict[str, pa.Table], dataset_id: str | None = None, version: int = 0,
+                 table_versions: Dict[str, int] | None = None, parent: "Dataset | None" = None,
+                 files: Dict[str, str] | None = None):
+        self.tables = tables
+        self.dataset_id = dataset_id or uuid.uuid4().hex
+        self.version = version
+        self.table_versions = table_versions or {name: version for name in tables}
+        self.parent = parent
+        self.files = files or {}
+
+    @classmethod
+    def from_records(cls, records: List[Dict]) -> "Dataset":
+        return cls({table["table_name"]: rows_to_table(table["rows"]) for table in records})
+
+    @property
+    def table_names(self) -> List[str]:
+        return list(self.tables)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(DATASET_DIR, self.dataset_id, MANIFEST.format(version=self.version))
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.tables
+
+    def table(self, name: str) -> pa.Table:
+        return self.tables[name]
+
+    def table_key(self, name: str) -> tuple:
+        return self.dataset_id, name, self.table_versions[name]
+
+    def num_rows(self) -> int:
+        return sum(table.num_rows for table in self.tables.values())
+
+    def with_tables(self, updated: Dict[str, pa.Table]) -> "Dataset":
+        version = next_version(self.dataset_id)
+        tables = dict(self.tables)
+        table_versions = dict(self.table_versions)
+        files = dict(self.files)
+        for name, table in updated.items():
+            tables[name] = table
+            table_versions[name] = version
+            files.pop(name, None)
+        prune_history(self)
+        return Dataset(tables, self.dataset_id, version, table_versions, self, files)
+
+    def to_records(self, names: Iterable[str] | None = None) -> List[Dict]:
+        names = self.table_names if names is None else [name for name in names if name in self.tables]
+        return [{"table_name": name, "rows": self.tables[name].to_pylist()} for name in names]
+
+    def save(self) -> str:
+        global _collected
+        if not _collected:
+            collect_expired_datasets()
+            _collected = True
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        for name, table in self.tables.items():
+            if name in self.files:
+                continue
+            file_name = f"{uuid.uuid4().hex}.arrow"
+            with pa.OSFile(os.path.join(directory, file_name), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            self.files[name] = file_name
+        manifest = {
+            "version": self.version,
+            "tables": [
+                {"name": name, "file": self.files[name], "version": self.table_versions[name]} for name in self.tables
+            ],
+            "parent": self.parent.path if self.parent is not None and os.path.exists(self.parent.path) else None,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.path)
+        remember(self)
+        return self.path
+
+
+def next_version(dataset_id: str) -> int:
+    # Versions only ever increase, even after an undo, so a new edit never
+    # takes over the preview cache entries or the manifest of a discarded one.
+    # Manifests on disk cover versions created before a restart.
+    directory = os.path.join(DATASET_DIR, dataset_id)
+    saved = [int(match.group(1)) for match in map(MANIFEST_NAME.fullmatch, os.listdir(directory)) if match] \
+        if os.path.isdir(directory) else []
+    with _versions_lock:
+        version = max([_versions.get(dataset_id, 0), *saved]) + 1
+        _versions[dataset_id] = version
+    return version
+
+
+def prune_history(dataset: Dataset):
+    for _ in range(MAX_HISTORY - 1):
+        if dataset.parent is None:
+            return
+        dataset = dataset.parent
+    dataset.parent = None
+
+
+def remember(dataset: Dataset):
+    with _loaded_lock:
+        _loaded[dataset.path] = dataset
+        _loaded.move_to_end(dataset.path)
+        while len(_loaded) > MAX_LOADED:
+            _loaded.popitem(last=False)
+
+
+def load_dataset(path: str) -> Dataset:
+    # Datasets saved by this process are handed over as-is; others are
+    # memory-mapped, so loading does not copy the table buffers.
+    with _loaded_lock:
+        if path in _loaded:
+            _loaded.move_to_end(path)
+            return _loaded[path]
+    with open(path) as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(path)
+    tables, table_versions, files = {}, {}, {}
+    for entry in manifest["tables"]:
+        source = pa.memory_map(os.path.join(directory, entry["file"]))
+        tables[entry["name"]] = pa.ipc.open_file(source).read_all()
+        table_versions[entry["name"]] = entry["version"]
+        files[entry["name"]] = entry["file"]
+    parent = None
+    if manifest["parent"] and os.path.exists(manifest["parent"]):
+        parent = load_dataset(manifest["parent"])
+    dataset = Dataset(tables, os.path.basename(directory), manifest["version"], table_versions, parent, files)
+    remember(dataset)
+    return dataset
+
+
+def collect_expired_datasets(ttl_hours: float = DATASET_TTL_HOURS):
+    if not os.path.isdir(DATASET_DIR):
+        return
+    cutoff = time.time() - ttl_hours * 3600
+    for dataset_id in os.listdir(DATASET_DIR):
+        directory = os.path.join(DATASET_DIR, dataset_id)
+        try:
+            if os.path.getmtime(directory) < cutoff:
+                shutil.rmtree(directory)
+        except OSError as e:
+            logging.warning(f"Could not remove expired dataset {dataset_id}: {e}")
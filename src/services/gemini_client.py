@@ -1,11 +1,43 @@
 from google import genai
 import os
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+from services.telemetry import record_generation
+from services.metrics import record_tokens
+from services import llm_cache
+
 load_dotenv()
 
+if llm_cache.LLM_CACHE_MODE == "replay":
+    # Replay never reaches the API, but genai.Client refuses to construct without credentials.
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-replay")
+
 client = genai.Client(
     vertexai=os.getenv("USE_VERTEXAI", "False") == "True",
     project=os.getenv("PROJECT_ID"),
     location=os.getenv("LOCATION")
 )
+
+
+def usage_details(response) -> dict:
+    usage = response.usage_metadata
+    if usage is None:
+        return {}
+    return {
+        "input": usage.prompt_token_count or 0,
+        "output": usage.candidates_token_count or 0,
+        "total": usage.total_token_count or 0
+    }
+
+
+def generate_content(name: str, model: str, contents, config=None, reusable: bool = True):
+    cached = llm_cache.lookup(name, model, contents, config, reusable)
+    if cached is not None:
+        return cached
+    start_time = datetime.now(timezone.utc)
+    response = client.models.generate_content(model=model, contents=contents, config=config)
+    llm_cache.store(model, contents, config, response, reusable)
+    record_generation(name, model, contents, config, response, start_time)
+    record_tokens(usage_details(response))
+    return response
@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOBS_DB = os.getenv("JOBS_DB", os.path.join(tempfile.gettempdir(), "data_assistant_jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_TTL_HOURS = float(os.getenv("JOB_TTL_HOURS", "24"))
+FINISHED = {"succeeded", "failed", "cancelled"}
+
+JOB_TYPES: Dict[str, Callable] = {}
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+    def progress(self, fraction: float, message: str):
+        # Every progress report is also a cancellation point.
+        self.check_cancelled()
+        with connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, message = ?, updated_at = ? WHERE id = ?",
+                (fraction, message, time.time(), self.job_id)
+            )
+
+    def check_cancelled(self):
+        with connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.job_id,)).fetchone()
+        if row and row[0]:
+            raise JobCancelled()
+
+
+def job(kind: str):
+    def decorator(func):
+        JOB_TYPES[kind] = func
+        return func
+    return decorator
+
+
+@contextmanager
+def connect():
+    conn = sqlite3.connect(JOBS_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def init_db():
+    os.makedirs(os.path.dirname(JOBS_DB) or ".", exist_ok=True)
+    with connect() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                message TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                params TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("DELETE FROM jobs WHERE updated_at < ?", (time.time() - JOB_TTL_HOURS * 3600,))
+        # Workers do not survive a restart: running jobs are marked failed and
+        # queued ones are submitted again below.
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Interrupted by a server restart', updated_at = ? WHERE status = 'running'",
+            (time.time(),)
+        )
+        return [row["id"] for row in conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at")]
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            queued = init_db()
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+            for job_id in queued:
+                _executor.submit(run_job, job_id)
+        return _executor
+
+
+def submit(kind: str, params: dict) -> str:
+    if kind not in JOB_TYPES:
+        raise ValueError(f"Unknown job type: {kind}")
+    executor = get_executor()
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, status, params, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, json.dumps(params), now, now)
+        )
+    executor.submit(run_job, job_id)
+    return job_id
+
+
+def run_job(job_id: str):
+    with connect() as conn:
+        row = conn.execute("SELECT kind, params, cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return
+        if row["cancel_requested"]:
+            finish(conn, job_id, "cancelled")
+            return
+        conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    try:
+        result = JOB_TYPES[row["kind"]](json.loads(row["params"]), JobContext(job_id))
+        status, error = "succeeded", None
+    except JobCancelled:
+        result, status, error = None, "cancelled", None
+    except Exception as e:
+        logging.exception(f"Job {job_id} ({row['kind']}) failed")
+        result, status, error = None, "failed", str(e)
+    with connect() as conn:
+        finish(conn, job_id, status, result, error)
+
+
+def finish(conn: sqlite3.Connection, job_id: str, status: str, result=None, error: str | None = None):
+    conn.execute(
+        "UPDATE jobs SET status = ?, progress = CASE WHEN ? THEN 1.0 ELSE progress END, result = ?, error = ?, updated_at = ? WHERE id = ?",
+        (status, status == "succeeded", json.dumps(result), error, time.time(), job_id)
+    )
+
+
+def get_job(job_id: str) -> dict | None:
+    get_executor()
+    with connect() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def cancel(job_id: str):
+    with connect() as conn:
+        conn.execute("UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ?", (time.time(), job_id))
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from google.genai import types
+from pydantic import BaseModel
+
+load_dotenv()
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(tempfile.gettempdir(), "data_assistant_llm_cache.sqlite3"))
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "256"))
+# off: never cache; readwrite: reuse temperature 0 responses; record: store every
+# response; replay: serve everything from the cache and fail on a miss.
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "readwrite")
+MODES = {"off", "readwrite", "record", "replay"}
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
+class LLMCacheMiss(Exception):
+    pass
+
+
+def to_jsonable(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def cache_key(model: str, contents, config) -> str:
+    if isinstance(config, dict):
+        # Dict and object configs for the same request must share an entry.
+        config = types.GenerateContentConfig.model_validate(config)
+    payload = json.dumps(
+        {"model": model, "config": to_jsonable(config), "contents": to_jsonable(contents)},
+        sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def is_deterministic(config) -> bool:
+    temperature = config.get("temperature") if isinstance(config, dict) else getattr(config, "temperature", None)
+    return temperature == 0
+
+
+# Requests that are not reusable (repair prompts, whose previous answer
+# failed) skip readwrite caching; record and replay still capture whole sessions.
+def reads_cache(config, reusable: bool = True) -> bool:
+    return LLM_CACHE_MODE == "replay" or (LLM_CACHE_MODE == "readwrite" and reusable and is_deterministic(config))
+
+
+def writes_cache(config, reusable: bool = True) -> bool:
+    return LLM_CACHE_MODE == "record" or (LLM_CACHE_MODE == "readwrite" and reusable and is_deterministic(config))
+
+
+@contextmanager
+def connect():
+    global _initialized
+    with _init_lock:
+        if not _initialized:
+            init_db()
+            _initialized = True
+    conn = sqlite3.connect(LLM_CACHE_PATH, timeout=10)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def init_db():
+    if LLM_CACHE_MODE not in MODES:
+        raise ValueError(f"Unknown LLM_CACHE_MODE: {LLM_CACHE_MODE}")
+    os.makedirs(os.path.dirname(LLM_CACHE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(LLM_CACHE_PATH, timeout=10)
+    try:
+        with conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used_at)")
+    finally:
+        conn.close()
+
+
+def lookup(name: str, model: str, contents, config, reusable: bool = True) -> types.GenerateContentResponse | None:
+    if not reads_cache(config, reusable):
+        return None
+    key = cache_key(model, contents, config)
+    try:
+        with connect() as conn:
+            row = conn.execute("SELECT response FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE entries SET last_used_at = ? WHERE key = ?", (time.time(), key))
+    except sqlite3.Error as e:
+        logging.warning(f"Could not read the model response cache: {e}")
+        row = None
+    if row is not None:
+        return types.GenerateContentResponse.model_validate_json(row[0])
+    if LLM_CACHE_MODE == "replay":
+        raise LLMCacheMiss(f"No cached response for {name} ({model}, key {key[:12]}) in replay mode")
+    return None
+
+
+def store(model: str, contents, config, response, reusable: bool = True):
+    if not writes_cache(config, reusable) or not isinstance(response, types.GenerateContentResponse):
+        return
+    key = cache_key(model, contents, config)
+    payload = response.model_dump_json(exclude_none=True)
+    now = time.time()
+    try:
+        with connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, model, response, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, payload, len(payload), now, now)
+            )
+            evict(conn)
+    except sqlite3.Error as e:
+        # A broken cache must never fail the request that produced the response.
+        logging.warning(f"Could not cache model response: {e}")
+
+
+def evict(conn: sqlite3.Connection):
+    limit = int(LLM_CACHE_MAX_MB * 1024 * 1024)
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= limit:
+        return
+    # Trim to 90% so eviction does not run again on every following insert.
+    excess = total - int(limit * 0.9)
+    removed = 0
+    keys = []
+    for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_used_at"):
+        keys.append((key,))
+        removed += size
+        if removed >= excess:
+            break
+    conn.executemany("DELETE FROM entries WHERE key = ?", keys)
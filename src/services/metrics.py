@@ -0,0 +1,225 @@
+import atexit
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_PORT = os.getenv("METRICS_PORT")
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    end: float | None = None
+    tokens: dict = field(default_factory=dict)
+    retries: int = 0
+    rows: int | None = None
+    error: str | None = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+
+class Turn:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: list[Span] = []
+
+    def waterfall(self) -> list[dict]:
+        return [
+            {
+                "stage": span.name,
+                "start_ms": round((span.start - self.start) * 1000, 1),
+                "end_ms": round(((span.end or span.start) - self.start) * 1000, 1),
+                "duration_ms": round(span.duration * 1000, 1),
+                "tokens": span.tokens.get("total", 0),
+                "retries": span.retries,
+                "rows": span.rows,
+                "error": span.error,
+            }
+            for span in self.spans
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = defaultdict(int)
+        self._errors = defaultdict(int)
+        self._retries = defaultdict(int)
+        self._rows = defaultdict(int)
+        self._tokens = defaultdict(int)
+        self._duration_sum = defaultdict(float)
+        self._duration_buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+
+    def observe(self, span: Span):
+        duration = span.duration
+        with self._lock:
+            self._calls[span.name] += 1
+            self._errors[span.name] += span.error is not None
+            self._retries[span.name] += span.retries
+            self._rows[span.name] += span.rows or 0
+            for kind, count in span.tokens.items():
+                self._tokens[(span.name, kind)] += count
+            self._duration_sum[span.name] += duration
+            buckets = self._duration_buckets[span.name]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+
+    def render(self) -> str:
+        prefix = "data_assistant_stage"
+        with self._lock:
+            lines = [
+                f"# HELP {prefix}_duration_seconds Wall time per pipeline stage.",
+                f"# TYPE {prefix}_duration_seconds histogram",
+            ]
+            for name, buckets in self._duration_buckets.items():
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'{prefix}_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'{prefix}_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {self._calls[name]}')
+                lines.append(f'{prefix}_duration_seconds_sum{{stage="{name}"}} {self._duration_sum[name]:.6f}')
+                lines.append(f'{prefix}_duration_seconds_count{{stage="{name}"}} {self._calls[name]}')
+            for metric, values, help_text in (
+                ("calls_total", self._calls, "Stage invocations."),
+                ("errors_total", self._errors, "Stage invocations that failed."),
+                ("retries_total", self._retries, "Repair attempts per stage."),
+                ("rows_total", self._rows, "Rows returned per stage."),
+            ):
+                lines.append(f"# HELP {prefix}_{metric} {help_text}")
+                lines.append(f"# TYPE {prefix}_{metric} counter")
+                for name, value in values.items():
+                    lines.append(f'{prefix}_{metric}{{stage="{name}"}} {value}')
+            lines.append(f"# HELP {prefix}_tokens_total Model tokens per stage.")
+            lines.append(f"# TYPE {prefix}_tokens_total counter")
+            for (name, kind), value in self._tokens.items():
+                lines.append(f'{prefix}_tokens_total{{stage="{name}",type="{kind}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
+_current_turn: contextvars.ContextVar[Turn | None] = contextvars.ContextVar("current_turn", default=None)
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("current_span", default=None)
+
+
+@contextmanager
+def start_turn():
+    turn = Turn()
+    token = _current_turn.set(turn)
+    try:
+        yield turn
+    finally:
+        _current_turn.reset(token)
+        export_metrics()
+
+
+@contextmanager
+def stage(name: str):
+    span = Span(name=name, start=time.perf_counter())
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.error = type(e).__name__
+        raise
+    finally:
+        span.end = time.perf_counter()
+        _current_span.reset(token)
+        registry.observe(span)
+        turn = _current_turn.get()
+        if turn is not None:
+            turn.spans.append(span)
+
+
+def timed(name: str):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_tokens(usage: dict):
+    span = _current_span.get()
+    if span is not None:
+        for kind, count in usage.items():
+            span.tokens[kind] = span.tokens.get(kind, 0) + count
+
+
+def record_rows(rows: int):
+    span = _current_span.get()
+    if span is not None:
+        span.rows = rows
+
+
+def record_retry():
+    span = _current_span.get()
+    if span is not None:
+        span.retries += 1
+
+
+def record_error(error: str):
+    span = _current_span.get()
+    if span is not None:
+        span.error = error.strip().splitlines()[-1][:200] if error.strip() else error
+
+
+def export_metrics():
+    if METRICS_FILE:
+        try:
+            registry.write(METRICS_FILE)
+        except OSError as e:
+            logging.warning(f"Could not write metrics file {METRICS_FILE}: {e}")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int):
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    except OSError as e:
+        logging.warning(f"Metrics endpoint not started on port {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+    return server
+
+
+if METRICS_PORT:
+    start_metrics_server(int(METRICS_PORT))
+atexit.register(export_metrics)
@@ -1,5 +1,7 @@
-from services.gemini_client import client
+from services.gemini_client import generate_content
 from services.sql_generation_service import sql_generation
+from services.plot_reduction import reduce_plot_data
+from services.sql_guard import PLOT_ROW_LIMIT
 import logging
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -7,20 +9,31 @@ import pandas as pd
 import uuid
 import os
 import traceback
+from services.metrics import timed, record_retry, record_error
 from google.genai import types
-from langfuse.decorators import observe,langfuse_context 
 from dotenv import load_dotenv
 load_dotenv()
 
+PLOT_MAX_REPAIRS = int(os.getenv("PLOT_MAX_REPAIRS", "3"))
 
-def plot_generator(user_query: str, ddl_schema: str, messages:str) -> dict:
+
+class PlotRepairFailed(Exception):
+    pass
+
+
+def plot_generator(user_query: str, ddl_schema: str, messages:str, schema_name: str) -> dict:
     error = 'first run'
+    repairs = 0
     while error:
-        sql_query, df = sql_generation(ddl_schema, user_query, messages)
+        if error != 'first run':
+            if repairs == PLOT_MAX_REPAIRS:
+                raise PlotRepairFailed(f"No working plot code after {PLOT_MAX_REPAIRS} repair attempts. Last error: {error}")
+            repairs += 1
+        sql_query, df = sql_generation(ddl_schema, user_query, messages, schema_name, row_limit=PLOT_ROW_LIMIT)
         logging.info(f"Dataframe: {df}")
         plot_request = generate_code_for_plot(user_query, ddl_schema, df, error, messages)
         logging.info(f"Code {plot_request}")
-        plot_path, error = execute_plot(plot_request, df)
+        plot_path, error = execute_plot(plot_request, reduce_plot_data(plot_request, df), df.attrs.get("truncated_at"))
         logging.info(plot_path)
     return plot_path, plot_request, error
 
@@ -40,9 +53,11 @@ plot_generation_declaration = {
         }
 }
 
-@observe(as_type="generation")
-def generate_code_for_plot(user_query: str, ddl_schema: str, df: str, error: str, messages: str) -> str:
-    if error != 'first run':
+@timed("generate_code_for_plot")
+def generate_code_for_plot(user_query: str, ddl_schema: str, df: pd.DataFrame, error: str, messages: str) -> str:
+    repair = error != 'first run'
+    if repair:
+        record_retry()
         prompt = f"""
         You previously generated an invalid plot code with the following error: {error}
         Please correct it based on the schema: {ddl_schema}
@@ -61,6 +76,10 @@ def generate_code_for_plot(user_query: str, ddl_schema: str, df: str, error: str
         User request:
         \"{user_query}\"
         """
+        if df.attrs.get("truncated_at"):
+            prompt += f"""
+        Note: the query returned more rows than the limit, the dataframe holds only the first {df.attrs["truncated_at"]} rows.
+        """
     gemini_messages = []
     for message in messages:
         if "role" in message and "content" in message:
@@ -69,21 +88,15 @@ def generate_code_for_plot(user_query: str, ddl_schema: str, df: str, error: str
             )
     gemini_messages.append(types.Content(role="user", parts=[types.Part(text=prompt)]))
     model = "gemini-2.0-flash"
-    response = client.models.generate_content(
+    response = generate_content(
+        "generate_code_for_plot",
         model=model,
         contents=gemini_messages,
         config={
             "temperature": 0.0
-        }
+        },
+        reusable=not repair
     )
-    langfuse_context.update_current_observation(
-    input=input,
-    model=model,
-    usage_details={
-          "input": response.usage_metadata.prompt_token_count,
-          "output": response.usage_metadata.candidates_token_count,
-          "total": response.usage_metadata.total_token_count
-      })
     raw = response.text.strip()
 
     if raw.startswith("```python"):
@@ -93,12 +106,18 @@ def generate_code_for_plot(user_query: str, ddl_schema: str, df: str, error: str
 
     return raw
 
-def execute_plot(plot_code: str, df: pd.DataFrame) -> tuple[str | None, str | None]:
+@timed("execute_plot")
+def execute_plot(plot_code: str, df: pd.DataFrame, truncated_at: int | None = None) -> tuple[str | None, str | None]:
     local_vars = {"df": df, "sns": sns, "plt": plt, "pd": pd}
 
     try:
         plt.clf()
         exec(plot_code, {}, local_vars)
+        if truncated_at:
+            plt.gcf().text(
+                0.0, 0.0, f"Only the first {truncated_at:,} rows of the query result are shown.",
+                fontsize=8, color="firebrick", ha="left", va="top"
+            )
 
         os.makedirs("plots", exist_ok=True)
         plot_path = f"plots/{uuid.uuid4().hex}.png"
@@ -108,4 +127,5 @@ def execute_plot(plot_code: str, df: pd.DataFrame) -> tuple[str | None, str | No
     except Exception as e:
         logging.error(f"Error: {e}")
         error_msg = traceback.format_exc()
+        record_error(error_msg)
         return None, error_msg
\ No newline at end of file
@@ -0,0 +1,255 @@
+import logging
+import os
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from services.metrics import timed, record_rows
+
+load_dotenv()
+
+PLOT_MAX_POINTS = int(os.getenv("PLOT_MAX_POINTS", "5000"))
+PLOT_MAX_CATEGORIES = int(os.getenv("PLOT_MAX_CATEGORIES", "20"))
+PLOT_SCATTER_BINS = int(os.getenv("PLOT_SCATTER_BINS", "100"))
+OTHER = "Other"
+# infer_dtype results of object columns that hold only numbers.
+NUMERIC_OBJECTS = {"decimal", "integer", "floating", "mixed-integer-float"}
+
+SERIES_PLOTS = {"lineplot"}
+SCATTER_PLOTS = {"scatterplot"}
+CATEGORICAL_PLOTS = {"barplot", "countplot", "boxplot", "boxenplot", "violinplot", "pointplot", "stripplot", "swarmplot"}
+# Categorical plots that draw every row as its own marker.
+POINT_PLOTS = {"stripplot", "swarmplot"}
+# Categorical plots that estimate a statistic per category; their cost grows
+# with the rows behind every category (bootstrapped error bars, KDEs).
+ESTIMATE_PLOTS = {"barplot", "pointplot", "boxplot", "boxenplot", "violinplot"}
+# Estimators a random sample of a category's rows still approximates; totals,
+# counts and custom functions need every row.
+SAMPLED_ESTIMATORS = {"mean", "median"}
+
+PLOT_CALL = re.compile(r"\b(sns|plt|ax)\.(\w+)\s*\(")
+KEYWORD = re.compile(r"\b(x|y|hue|kind)\s*=\s*(['\"])(.*?)\2")
+ESTIMATOR = re.compile(r"\bestimator\s*=\s*([^,]+)")
+COLUMN = re.compile(r"""\bdf\s*\[\s*(['"])(.*?)\1\s*\]""")
+DATA_FRAME = re.compile(r"(?:^|,)\s*(?:data\s*=\s*)?df\s*(?:,|$)")
+# Any rebinding or in-place change of df means the plotted frame is not the query result.
+REBINDS_DF = re.compile(r"\bdf\s*(?:\[[^\]]*\]\s*|\.\w+\s*)?=(?!=)|\binplace\s*=\s*True\b")
+
+
+@dataclass
+class PlotCall:
+    kind: str
+    x: str | None = None
+    y: str | None = None
+    hue: str | None = None
+    estimator: str = "mean"
+
+
+def call_arguments(code: str, start: int) -> str:
+    depth = 1
+    for i in range(start, len(code)):
+        if code[i] == "(":
+            depth += 1
+        elif code[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return code[start:i]
+    return code[start:]
+
+
+def detect_plot(code: str) -> PlotCall | None:
+    if REBINDS_DF.search(code):
+        return None
+    calls = []
+    for match in PLOT_CALL.finditer(code):
+        module, function = match.groups()
+        args = call_arguments(code, match.end())
+        if module == "sns":
+            if not DATA_FRAME.search(args):
+                continue
+            keywords = {key: value for key, _, value in KEYWORD.findall(args)}
+            kind = function
+            if function == "relplot":
+                kind = "lineplot" if keywords.get("kind") == "line" else "scatterplot"
+            elif function == "catplot":
+                kind = f"{keywords.get('kind', 'strip')}plot"
+            calls.append(PlotCall(kind, keywords.get("x"), keywords.get("y"), keywords.get("hue"), estimator_of(args)))
+        elif function in ("plot", "scatter"):
+            columns = [column for _, column in COLUMN.findall(args)]
+            if len(columns) >= 2:
+                calls.append(PlotCall("lineplot" if function == "plot" else "scatterplot", columns[0], columns[1]))
+    # Several plots may need different reductions of the same frame, so only
+    # a single recognised plot call is reduced.
+    return calls[0] if len(calls) == 1 else None
+
+
+def estimator_of(args: str) -> str:
+    match = ESTIMATOR.search(args)
+    if match is None:
+        return "mean"
+    # "median", np.median and statistics.median all name the same estimator.
+    return match.group(1).strip().strip("'\"").rsplit(".", 1)[-1].lower()
+
+
+def is_continuous(series: pd.Series) -> bool:
+    return (pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)) \
+        or pd.api.types.is_datetime64_any_dtype(series)
+
+
+def numeric_objects(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+    # psycopg2 returns NUMERIC values (and AVG or SUM over them) as Decimal,
+    # which pandas keeps in object columns that would not count as continuous.
+    converted = {
+        column: pd.to_numeric(df[column]) for column in columns
+        if df[column].dtype == object and pd.api.types.infer_dtype(df[column], skipna=True) in NUMERIC_OBJECTS
+    }
+    return df.assign(**converted) if converted else df
+
+
+def as_float(series: pd.Series) -> np.ndarray:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+    return series.to_numpy(dtype=np.float64)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of `threshold` points that keep the visual shape of the series."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    # Average point of every bucket, used as the third triangle vertex for the bucket before it.
+    counts = np.diff(edges)
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_series(df: pd.DataFrame, plot: PlotCall, max_points: int) -> pd.DataFrame | None:
+    # lineplot aggregates rows sharing an x value; dropping some of them
+    # would change the plotted estimate, so only distinct x values are thinned.
+    if plot.estimator != "none" and df.duplicated([plot.x] if plot.hue is None else [plot.hue, plot.x]).any():
+        return None
+    df = df.dropna(subset=[plot.x, plot.y]).sort_values(plot.x, kind="stable")
+    groups = [df] if plot.hue is None else [group for _, group in df.groupby(plot.hue, sort=False, dropna=False)]
+    budget = max(3, max_points // len(groups))
+    reduced = []
+    for group in groups:
+        keep = lttb(as_float(group[plot.x]), as_float(group[plot.y]), budget)
+        reduced.append(group.iloc[keep])
+    return pd.concat(reduced)
+
+
+def bin_scatter(df: pd.DataFrame, plot: PlotCall, bins: int) -> pd.DataFrame:
+    # Points falling into the same cell of a bins x bins grid are merged into
+    # their mean, so the plotted cloud keeps its shape with bounded markers.
+    df = df.dropna(subset=[plot.x, plot.y])
+    cells = []
+    for column in (plot.x, plot.y):
+        values = as_float(df[column])
+        low, high = values.min(), values.max()
+        scale = bins / (high - low) if high > low else 0.0
+        cells.append(np.minimum(((values - low) * scale).astype(np.int64), bins - 1))
+    keys = [cells[0] * bins + cells[1]]
+    hue = plot.hue if plot.hue is not None and not is_continuous(df[plot.hue]) else None
+    if hue is not None:
+        keys.append(df[hue])
+    aggregations = {
+        column: "mean" if is_continuous(df[column]) else "first" for column in df.columns if column != hue
+    }
+    grouped = df.groupby(keys, sort=False, dropna=False).agg(aggregations)
+    if hue is not None:
+        grouped[hue] = grouped.index.get_level_values(1)
+    return grouped.reset_index(drop=True)[list(df.columns)]
+
+
+def top_categories(df: pd.DataFrame, column: str, value: str | None, max_categories: int) -> pd.DataFrame:
+    labels = df[column].astype(object)
+    if labels.nunique(dropna=True) <= max_categories:
+        return df
+    if value is not None and is_continuous(df[value]) and not pd.api.types.is_datetime64_any_dtype(df[value]):
+        ranking = df[value].abs().groupby(labels).sum()
+    else:
+        ranking = labels.value_counts()
+    top = ranking.nlargest(max_categories - 1).index
+    df = df.copy()
+    df[column] = labels.where(labels.isin(top) | labels.isna(), OTHER)
+    return df
+
+
+def sample(df: pd.DataFrame, max_points: int) -> pd.DataFrame:
+    if len(df) <= max_points:
+        return df
+    return df.sample(n=max_points, random_state=0).sort_index()
+
+
+def sample_per_category(df: pd.DataFrame, columns: list, max_points: int) -> pd.DataFrame:
+    # Every category keeps up to max_points random rows, so small categories
+    # stay exact and large ones are estimated from a bounded sample.
+    shuffled = df.sample(frac=1.0, random_state=0)
+    return shuffled.groupby(columns, sort=False, dropna=False).head(max_points).sort_index()
+
+
+def reduce_categories(df: pd.DataFrame, plot: PlotCall, max_categories: int) -> tuple[pd.DataFrame, list]:
+    axes = [column for column in (plot.x, plot.y) if column is not None]
+    categorical = [column for column in axes if not is_continuous(df[column])] or axes[:1]
+    for column in categorical:
+        value = next((other for other in axes if other != column), None)
+        df = top_categories(df, column, value, max_categories)
+    if plot.hue is not None and not is_continuous(df[plot.hue]):
+        df = top_categories(df, plot.hue, None, max_categories)
+        categorical.append(plot.hue)
+    return df, categorical
+
+
+@timed("reduce_plot_data")
+def reduce_plot_data(plot_code: str, df: pd.DataFrame) -> pd.DataFrame:
+    if len(df) <= PLOT_MAX_POINTS:
+        return df
+    plot = detect_plot(plot_code)
+    if plot is None:
+        return df
+    rows = len(df)
+    columns = [column for column in (plot.x, plot.y, plot.hue) if column is not None]
+    if not columns or any(column not in df.columns for column in columns):
+        return df
+    df = numeric_objects(df, columns)
+
+    try:
+        if plot.kind in SERIES_PLOTS and plot.x and plot.y and is_continuous(df[plot.x]) and is_continuous(df[plot.y]):
+            reduced = downsample_series(df, plot, PLOT_MAX_POINTS)
+            if reduced is None:
+                return df
+        elif plot.kind in SCATTER_PLOTS and plot.x and plot.y and is_continuous(df[plot.x]) and is_continuous(df[plot.y]):
+            if plot.hue is not None and not is_continuous(df[plot.hue]):
+                df = top_categories(df, plot.hue, None, PLOT_MAX_CATEGORIES)
+            reduced = bin_scatter(df, plot, PLOT_SCATTER_BINS)
+        elif plot.kind in CATEGORICAL_PLOTS:
+            reduced, categories = reduce_categories(df, plot, PLOT_MAX_CATEGORIES)
+            if plot.kind in POINT_PLOTS:
+                reduced = sample(reduced, PLOT_MAX_POINTS)
+            elif plot.kind in ESTIMATE_PLOTS and plot.estimator in SAMPLED_ESTIMATORS:
+                reduced = sample_per_category(reduced, categories, PLOT_MAX_POINTS)
+        else:
+            return df
+    except (TypeError, ValueError) as e:
+        logging.warning(f"Plot data reduction for {plot.kind} failed, plotting all rows: {e}")
+        return df
+
+    logging.info(f"Reduced {plot.kind} data from {rows} to {len(reduced)} rows")
+    record_rows(len(reduced))
+    return reduced
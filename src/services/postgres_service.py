@@ -1,74 +1,181 @@
 import os
 import psycopg2
 import pandas as pd
-import streamlit as st
-from typing import List, Dict, Tuple, Set
+import pyarrow as pa
+from typing import Callable, List, Dict, Tuple, Set
 from collections import defaultdict, deque
 from dotenv import load_dotenv
 import re
-from sqlalchemy import create_engine
+from functools import lru_cache
+from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 import logging
 
+from services.metrics import timed, record_rows, record_error
+from services.schema_sync import (
+    TableSpec, load_sync_state, load_live_columns, plan_sync, apply_sync_plan, copy_table, write_sync_state
+)
+from services.type_coercion import coerce_dataset
+from services.dataset_store import Dataset, hash_table
+from services.aggregate_summaries import (
+    ensure_summary_registry, drop_summaries, refresh_summaries, remove_patterns, match_summary, rewrite_query
+)
+from services.schema_profiler import profile_schema_async, remove_profile
+from services.sql_guard import (
+    STATEMENT_TIMEOUT_MS, DEFAULT_ROW_LIMIT, SqlRejected, prepare_query, begin_guarded_transaction,
+    restrict_to_schema, check_plan
+)
+from services.schema_registry import (
+    ensure_registry, lock_schema, register_schema, grant_reader, touch_schema, collect_expired_schemas, staging_schema_for,
+    SchemaNotLoaded
+)
+
 load_dotenv()
 
-def execute_ddl_and_save_data(ddl_text: str, data_tables: List[Dict]):
+def get_connection():
+    return psycopg2.connect(
+        host=os.getenv("POSTGRES_HOST"),
+        database=os.getenv("DATABASE"),
+        user=os.getenv("USER"),
+        password=os.getenv("PASSWORD")
+    )
+
+def execute_ddl_and_save_data(ddl_text: str, dataset: Dataset, schema_name: str,
+                              progress: Callable[[float, str], None] | None = None) -> str:
+    # progress may raise to cancel the save; nothing is committed until the end.
+    progress = progress or (lambda fraction, message: None)
+    conn = None
     try:
-        conn = psycopg2.connect(
-            host=os.getenv("POSTGRES_HOST"),
-            database=os.getenv("DATABASE"),
-            user=os.getenv("USER"),
-            password=os.getenv("PASSWORD")
-        )
-        cursor = conn.cursor()
-        remove_existing_tables(cursor, conn)
         ddl_postgres = convert_mysql_to_postgres(ddl_text, use_pg_enums=True)
         ddl_cleaned = convert_with_cycle_support(ddl_postgres)
-        cursor.execute(ddl_cleaned)
-
-        for table in data_tables:
-            table_name = table["table_name"]
-            rows = table["rows"]
-            if not rows:
-                continue
-
-            df = pd.DataFrame(rows)
-            if df.empty:
-                continue
-
-            columns = list(df.columns)
-            placeholders = ', '.join(['%s'] * len(columns))
-            insert_query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
-
-            for _, row in df.iterrows():
-                values = tuple(row[col] for col in columns)
-                cursor.execute(insert_query, values)
+        specs, enums = build_table_specs(ddl_cleaned)
+        data_by_table = {name.lower(): dataset.table(name) for name in dataset.table_names}
+        data_hashes = {name: hash_table(data_by_table[name]) if name in data_by_table else None for name in specs}
+
+        progress(0.1, "Checking data types")
+        conn = get_connection()
+        ensure_registry(conn)
+        ensure_summary_registry(conn)
+        cursor = conn.cursor()
+        lock_schema(cursor, schema_name)
+
+        plan = None
+        state = load_sync_state(cursor, schema_name)
+        if state is not None:
+            plan = plan_sync(specs, enums, data_hashes, state, load_live_columns(cursor, schema_name))
+            if plan.rebuild_reason:
+                logging.info(f"Rebuilding schema {schema_name}: {plan.rebuild_reason}")
+
+        # Coercion runs before any statement is applied, so bad values abort
+        # the save up front. Tables the sync leaves untouched are skipped.
+        if plan is not None and not plan.rebuild_reason:
+            tables = coerce_dataset({name: specs[name] for name in plan.reload}, enums, data_by_table)
+            progress(0.3, f"Loading {len(plan.reload)} changed tables")
+            cursor.execute(f'SET LOCAL search_path TO "{schema_name}"')
+            # Summaries would block ALTER COLUMN and DROP COLUMN, so they are rebuilt after DDL changes.
+            if plan.changes_ddl:
+                drop_summaries(cursor, schema_name)
+            cursor.execute("SAVEPOINT schema_sync")
+            try:
+                apply_sync_plan(cursor, plan, tables)
+                cursor.execute("RELEASE SAVEPOINT schema_sync")
+                changed_tables = None if plan.changes_ddl else set(plan.reload)
+            except psycopg2.Error as e:
+                # Changes Postgres cannot apply in place (e.g. a type without a
+                # cast) fall back to building the schema from scratch.
+                cursor.execute("ROLLBACK TO SAVEPOINT schema_sync")
+                logging.warning(f"Incremental sync of {schema_name} failed, rebuilding: {e}")
+                plan = None
+        if plan is None or plan.rebuild_reason:
+            tables = coerce_dataset(specs, enums, data_by_table)
+            progress(0.3, "Loading tables")
+            rebuild_schema(cursor, schema_name, ddl_cleaned, specs, tables)
+            changed_tables = None
+        write_sync_state(cursor, schema_name, specs, enums, data_hashes)
+        register_schema(cursor, schema_name)
+        progress(0.8, "Refreshing summaries")
+        refresh_summaries(cursor, schema_name, changed_tables)
+        grant_reader(cursor, schema_name)
 
         conn.commit()
         cursor.close()
-        conn.close()
-        st.success("Tables created and data saved successfully!")
-    except Exception as e:
-        st.error(f"Error: {e}")
-
-def remove_existing_tables(cursor, conn):
-    try:
-        cursor.execute("""
-            DO $$
-            DECLARE
-                r RECORD;
-            BEGIN
-                FOR r IN (SELECT tablename FROM pg_tables WHERE schemaname = 'public') LOOP
-                    EXECUTE format('DROP TABLE IF EXISTS %I CASCADE', r.tablename);
-                END LOOP;
-                FOR r IN (SELECT typname FROM pg_type WHERE typnamespace = 'public'::regnamespace AND typtype = 'e') LOOP
-                    EXECUTE format('DROP TYPE IF EXISTS %I CASCADE', r.typname);
-                END LOOP;
-            END $$;
-        """)
-        conn.commit()
-    except Exception as e:
-        st.error(f"Error removing existing tables: {e}")
+        profile_schema_async(schema_name)
+        for expired in collect_expired_schemas(conn):
+            remove_profile(expired)
+            remove_patterns(conn, expired)
+        return "Tables created and data saved successfully!"
+    finally:
+        if conn is not None:
+            conn.close()
+
+def rebuild_schema(cursor, schema_name: str, ddl_cleaned: str, specs: Dict[str, TableSpec], tables: Dict[str, pa.Table]):
+    # Build into a staging schema and swap it in on commit, so readers of
+    # the live schema never see a half-loaded dataset.
+    staging = staging_schema_for(schema_name)
+    cursor.execute(f'DROP SCHEMA IF EXISTS "{staging}" CASCADE')
+    cursor.execute(f'CREATE SCHEMA "{staging}"')
+    cursor.execute(f'SET LOCAL search_path TO "{staging}"')
+    cursor.execute(ddl_cleaned)
+
+    for table_name in specs:
+        copy_table(cursor, table_name, tables.get(table_name))
+
+    cursor.execute(f'DROP SCHEMA IF EXISTS "{schema_name}" CASCADE')
+    cursor.execute(f'ALTER SCHEMA "{staging}" RENAME TO "{schema_name}"')
+
+def build_table_specs(ddl_cleaned: str) -> Tuple[Dict[str, TableSpec], Dict[str, str]]:
+    enums = {}
+    for enum_sql in extract_enum_types(ddl_cleaned):
+        enums[re.match(r"CREATE TYPE (\w+)", enum_sql, re.IGNORECASE).group(1).lower()] = enum_sql
+
+    deferred = defaultdict(list)
+    for match in re.finditer(r"ALTER TABLE (\w+) ADD .*?;", ddl_cleaned, re.IGNORECASE | re.DOTALL):
+        deferred[match.group(1).lower()].append(match.group(0))
+
+    specs = {}
+    for table_name, table_sql in extract_table_definitions(ddl_cleaned).items():
+        name = table_name.lower()
+        columns, constraints = parse_table_columns(table_sql)
+        references = extract_foreign_keys(table_sql) + [
+            ref for fk_sql in deferred[name] for ref in extract_foreign_keys(fk_sql)
+        ]
+        specs[name] = TableSpec(
+            name=name,
+            sql=table_sql,
+            columns=columns,
+            constraints=constraints,
+            deferred_fks=deferred[name],
+            references=[ref.lower() for ref in references]
+        )
+    return specs, enums
+
+def split_top_level(body: str) -> List[str]:
+    items, depth, current = [], 0, []
+    for char in body:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            items.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    if "".join(current).strip():
+        items.append("".join(current).strip())
+    return items
+
+def parse_table_columns(table_sql: str) -> Tuple[Dict[str, str], List[str]]:
+    body = table_sql[table_sql.index("(") + 1:table_sql.rindex(")")]
+    columns, constraints = {}, []
+    for item in split_top_level(body):
+        item = " ".join(item.split())
+        if re.match(r"(PRIMARY\s+KEY|FOREIGN\s+KEY|CONSTRAINT|UNIQUE|CHECK|KEY|INDEX)\b", item, re.IGNORECASE):
+            constraints.append(item)
+            continue
+        name, _, definition = item.partition(" ")
+        columns[name.strip('"').lower()] = definition
+    return columns, constraints
 
 def convert_enum_to_pgtype(enum_sql: str) -> Tuple[str, List[str]]:
     enums = []
@@ -220,6 +327,7 @@ def convert_with_cycle_support(sql: str) -> str:
     return "\n\n".join(output_sql)
 
 
+@lru_cache(maxsize=1)
 def get_engine():
     user = os.getenv("USER")
     password = os.getenv("PASSWORD")
@@ -229,18 +337,74 @@ def get_engine():
     return create_engine(f"postgresql+psycopg2://{user}:{password}@{host}/{database}")
 
 
-def execute_sql(query: str) -> tuple[pd.DataFrame | None, str | None]:
+@timed("execute_sql")
+def execute_sql(query: str, schema_name: str, timeout_ms: int = STATEMENT_TIMEOUT_MS,
+                row_limit: int = DEFAULT_ROW_LIMIT) -> tuple[pd.DataFrame | None, str | None]:
     engine = get_engine()
     try:
         with engine.connect() as conn:
+            ensure_registry(conn.connection.dbapi_connection)
+            if not touch_schema(conn.connection.dbapi_connection, schema_name):
+                # No rewrite of the query can fix a missing dataset, so this
+                # is raised rather than handed to the repair loop.
+                raise SchemaNotLoaded('No data has been saved for this chat yet. Generate data and click "Save locally" first.')
             try:
-                df = pd.read_sql_query(query, conn)
+                query, injected_limit = prepare_query(query, schema_name, row_limit)
+                with conn.begin():
+                    begin_guarded_transaction(conn, timeout_ms)
+                    conn.execute(text("SELECT set_config('search_path', :schema, true)"), {"schema": f'"{schema_name}"'})
+                    # The summary registry is shared by all schemas, so it is read before the role switch.
+                    match = find_query_summary(conn, query, schema_name)
+                    restrict_to_schema(conn, schema_name)
+                    df = read_summary(conn, query, match, schema_name) if match else None
+                    if df is None:
+                        # Queries reach psycopg2 through exec_driver_sql, which treats % as a placeholder.
+                        query = query.replace("%", "%%")
+                        check_plan(conn, query)
+                        df = pd.read_sql_query(query, conn)
                 logging.info("Lack of errors in SQL execution")
+                if injected_limit is not None and len(df) > injected_limit:
+                    # Callers report this to the user instead of presenting a partial result as complete.
+                    df = df.iloc[:injected_limit]
+                    df.attrs["truncated_at"] = injected_limit
+                    logging.warning(f"Query result truncated to {injected_limit} rows")
+                record_rows(len(df))
                 return df, None
+            except SqlRejected as e:
+                logging.warning(str(e))
+                record_error(str(e))
+                return None, str(e)
             except Exception as e:
                 logging.error(f"Error during SQL query execution: {e}")
+                record_error(str(e))
                 return None, str(e)
     except SQLAlchemyError as e:
+        record_error(str(e))
         return None, str(e)
 
 
+def find_query_summary(conn, query: str, schema_name: str):
+    try:
+        with conn.begin_nested():
+            return match_summary(conn, query, schema_name)
+    except Exception as e:
+        logging.warning(f"Summary lookup failed, falling back to base tables: {e}")
+        return None
+
+
+def read_summary(conn, query: str, match, schema_name: str) -> pd.DataFrame | None:
+    # A summary dropped or changed by a concurrent save must not fail the
+    # user's query, so errors roll back to a savepoint and the base tables are used.
+    try:
+        with conn.begin_nested():
+            summary_query = rewrite_query(conn, query, match, schema_name)
+            if summary_query is None:
+                return None
+            summary_query = summary_query.replace("%", "%%")
+            check_plan(conn, summary_query)
+            df = pd.read_sql_query(summary_query, conn)
+        logging.info("Query answered from a materialized summary")
+        return df
+    except Exception as e:
+        logging.warning(f"Summary query failed, falling back to base tables: {e}")
+        return None
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+MAX_ENTRIES = 16
+
+
+class TablePreview:
+    def __init__(self, table: pa.Table):
+        self.table = table
+        self._stats = None
+
+    @property
+    def num_rows(self) -> int:
+        return self.table.num_rows
+
+    def page_count(self, page_size: int) -> int:
+        return max(1, -(-self.num_rows // page_size))
+
+    def page(self, page: int, page_size: int) -> pd.DataFrame:
+        return self.table.slice(page * page_size, page_size).to_pandas()
+
+    def stats(self) -> pd.DataFrame:
+        if self._stats is None:
+            self._stats = pd.DataFrame([column_stats(name, self.table[name]) for name in self.table.column_names])
+        return self._stats
+
+
+def column_stats(name: str, column: pa.ChunkedArray) -> dict:
+    stats = {
+        "column": name,
+        "type": str(column.type),
+        "nulls": column.null_count,
+        "distinct": None,
+        "min": None,
+        "max": None,
+    }
+    # Arrow has no distinct count or ordering for null, list, struct or map
+    # columns; those fields stay empty instead of failing the whole preview.
+    if pa.types.is_null(column.type) or pa.types.is_nested(column.type):
+        return stats
+    try:
+        stats["distinct"] = pc.count_distinct(column, mode="only_valid").as_py()
+        if pa.types.is_integer(column.type) or pa.types.is_floating(column.type) or pa.types.is_decimal(column.type) \
+                or pa.types.is_temporal(column.type) or pa.types.is_string(column.type) \
+                or pa.types.is_large_string(column.type):
+            bounds = pc.min_max(column)
+            stats["min"], stats["max"] = str(bounds["min"].as_py()), str(bounds["max"].as_py())
+    except pa.ArrowNotImplementedError:
+        pass
+    return stats
+
+
+class PreviewCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, TablePreview] = OrderedDict()
+
+    def get(self, key: Hashable, build: Callable[[], pa.Table]) -> TablePreview:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        preview = TablePreview(build())
+        self._entries[key] = preview
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return preview
@@ -0,0 +1,287 @@
+import difflib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import Counter, deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "data_assistant_profiles"))
+MAX_VALUES = int(os.getenv("PROFILE_MAX_VALUES", "50"))
+# Text columns with at most this many distinct values have all of them
+# indexed; larger ones only the ANALYZE histogram bounds.
+MAX_LOOKUP_VALUES = int(os.getenv("PROFILE_MAX_LOOKUP_VALUES", "1000"))
+MAX_GROUNDING_LINES = 20
+FUZZY_CUTOFF = 0.8
+FUZZY_CANDIDATES = 20
+NON_TEXT_TYPES = {
+    "integer", "bigint", "smallint", "numeric", "real", "double precision", "boolean",
+    "date", "timestamp without time zone", "timestamp with time zone"
+}
+
+_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+_cache: dict[str, tuple[float, dict]] = {}
+_grounding: dict[tuple[str, float, str], str] = {}
+
+
+def profile_path(schema_name: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{schema_name}.json")
+
+
+def profile_schema_async(schema_name: str):
+    threading.Thread(target=profile_schema, args=(schema_name,), name=f"profiler-{schema_name}", daemon=True).start()
+
+
+def profile_schema(schema_name: str):
+    from services.postgres_service import get_connection
+    from services.schema_sync import SYNC_TABLE
+
+    with _locks_guard:
+        lock = _locks.setdefault(schema_name, threading.Lock())
+    with lock:
+        conn = None
+        try:
+            conn = get_connection()
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                profile = build_profile(cursor, schema_name, SYNC_TABLE)
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            tmp_path = f"{profile_path(schema_name)}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(profile, f, separators=(",", ":"))
+            os.replace(tmp_path, profile_path(schema_name))
+            # Builds the lookup indexes here rather than on the first question.
+            load_profile(schema_name)
+            logging.info(f"Profiled schema {schema_name}: {len(profile['tables'])} tables")
+        except Exception as e:
+            logging.warning(f"Profiling schema {schema_name} failed: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def build_profile(cursor, schema_name: str, skip_table: str) -> dict:
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind = 'r' AND c.relname <> %s
+    """, (schema_name, skip_table))
+    tables = {name: {"row_estimate": None, "columns": {}} for name, in cursor.fetchall()}
+    for table in tables:
+        cursor.execute(f'ANALYZE "{schema_name}"."{table}"')
+
+    cursor.execute("""
+        SELECT c.relname, c.reltuples
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = ANY(%s)
+    """, (schema_name, list(tables)))
+    for name, reltuples in cursor.fetchall():
+        tables[name]["row_estimate"] = max(int(reltuples), 0)
+
+    cursor.execute("""
+        SELECT col.table_name, col.column_name, col.data_type, col.udt_name
+        FROM information_schema.columns col
+        WHERE col.table_schema = %s
+        ORDER BY col.table_name, col.ordinal_position
+    """, (schema_name,))
+    for table, column, data_type, udt_name in cursor.fetchall():
+        if table in tables:
+            tables[table]["columns"][column] = {"type": udt_name if data_type == "USER-DEFINED" else data_type}
+
+    # pg_stats holds ANALYZE's sampled n_distinct estimate and most-common-value
+    # sketch, so nothing here scans whole tables.
+    cursor.execute("""
+        SELECT tablename, attname, null_frac, n_distinct,
+               most_common_vals::text::text[], histogram_bounds::text::text[]
+        FROM pg_stats WHERE schemaname = %s
+    """, (schema_name,))
+    for table, column, null_frac, n_distinct, common_values, histogram in cursor.fetchall():
+        if table not in tables or column not in tables[table]["columns"]:
+            continue
+        rows = tables[table]["row_estimate"] or 0
+        stats = tables[table]["columns"][column]
+        stats["null_frac"] = round(null_frac, 4)
+        stats["distinct"] = int(-n_distinct * rows) if n_distinct < 0 else int(n_distinct)
+        if common_values:
+            stats["values"] = common_values[:MAX_VALUES]
+        if histogram:
+            stats["min"], stats["max"] = histogram[0], histogram[-1]
+            # Values seen once never make most_common_vals; the histogram
+            # bounds are a sample of them.
+            if stats["type"] not in NON_TEXT_TYPES:
+                stats["lookup"] = histogram
+
+    cursor.execute("""
+        SELECT t.typname, array_agg(e.enumlabel ORDER BY e.enumsortorder)
+        FROM pg_type t
+        JOIN pg_enum e ON e.enumtypid = t.oid
+        JOIN pg_namespace n ON n.oid = t.typnamespace
+        WHERE n.nspname = %s
+        GROUP BY t.typname
+    """, (schema_name,))
+    enums = dict(cursor.fetchall())
+    for table_name, table in tables.items():
+        for column, stats in table["columns"].items():
+            if stats["type"] in enums:
+                stats["values"] = enums[stats["type"]]
+                stats.pop("lookup", None)
+            elif stats["type"] not in NON_TEXT_TYPES and 0 < stats.get("distinct", 0) <= MAX_LOOKUP_VALUES:
+                # One scan per small text column, once per save, indexes every value.
+                cursor.execute(
+                    f'SELECT DISTINCT "{column}"::text FROM "{schema_name}"."{table_name}" WHERE "{column}" IS NOT NULL LIMIT %s',
+                    (MAX_LOOKUP_VALUES,)
+                )
+                stats["lookup"] = [value for value, in cursor.fetchall()]
+
+    cursor.execute("""
+        SELECT kcu.table_name, kcu.column_name, ccu.table_name, ccu.column_name
+        FROM information_schema.table_constraints tc
+        JOIN information_schema.key_column_usage kcu
+          ON kcu.constraint_name = tc.constraint_name AND kcu.constraint_schema = tc.constraint_schema
+        JOIN information_schema.constraint_column_usage ccu
+          ON ccu.constraint_name = tc.constraint_name AND ccu.constraint_schema = tc.constraint_schema
+        WHERE tc.constraint_type = 'FOREIGN KEY' AND tc.table_schema = %s
+    """, (schema_name,))
+    foreign_keys = [
+        {"table": table, "column": column, "ref_table": ref_table, "ref_column": ref_column}
+        for table, column, ref_table, ref_column in cursor.fetchall()
+    ]
+    return {"schema": schema_name, "tables": tables, "foreign_keys": foreign_keys}
+
+
+def load_profile(schema_name: str) -> dict | None:
+    path = profile_path(schema_name)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _cache.get(schema_name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path) as f:
+        profile = json.load(f)
+    profile["value_index"] = build_value_index(profile)
+    profile["trigram_index"] = build_trigram_index(profile["value_index"])
+    _cache[schema_name] = (mtime, profile)
+    return profile
+
+
+def build_value_index(profile: dict) -> dict[str, list[tuple[str, str, str]]]:
+    index = {}
+    for table, info in profile["tables"].items():
+        for column, stats in info["columns"].items():
+            if stats["type"] in NON_TEXT_TYPES:
+                continue
+            for value in dict.fromkeys([*stats.get("values", []), *stats.get("lookup", [])]):
+                index.setdefault(str(value).lower(), []).append((table, column, value))
+    return index
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def build_trigram_index(value_index: dict) -> dict[str, list[str]]:
+    index = {}
+    for key in value_index:
+        for gram in trigrams(key):
+            index.setdefault(gram, []).append(key)
+    return index
+
+
+def closest_value(phrase: str, trigram_index: dict[str, list[str]]) -> str | None:
+    # Strings within FUZZY_CUTOFF of each other share most of their trigrams,
+    # so difflib only compares the keys sharing the most with the phrase.
+    shared = Counter()
+    for gram in trigrams(phrase):
+        shared.update(trigram_index.get(gram, ()))
+    candidates = [key for key, _ in shared.most_common(FUZZY_CANDIDATES)]
+    close = difflib.get_close_matches(phrase, candidates, n=1, cutoff=FUZZY_CUTOFF)
+    return close[0] if close else None
+
+
+def remove_profile(schema_name: str):
+    _cache.pop(schema_name, None)
+    for key in [key for key in _grounding if key[0] == schema_name]:
+        _grounding.pop(key, None)
+    try:
+        os.remove(profile_path(schema_name))
+    except OSError:
+        pass
+
+
+def join_path(foreign_keys: list[dict], start: str, goal: str) -> list[str] | None:
+    edges = {}
+    for fk in foreign_keys:
+        condition = f"{fk['table']}.{fk['column']} = {fk['ref_table']}.{fk['ref_column']}"
+        edges.setdefault(fk["table"], []).append((fk["ref_table"], condition))
+        edges.setdefault(fk["ref_table"], []).append((fk["table"], condition))
+    queue, seen = deque([(start, [])]), {start}
+    while queue:
+        table, path = queue.popleft()
+        if table == goal:
+            return path
+        for neighbor, condition in edges.get(table, []):
+            if neighbor not in seen:
+                seen.add(neighbor)
+                queue.append((neighbor, path + [condition]))
+    return None
+
+
+def grounding_context(schema_name: str, question: str) -> str:
+    profile = load_profile(schema_name)
+    if not profile:
+        return ""
+    # Repairs and candidates ask again for the same question.
+    key = (schema_name, _cache[schema_name][0], question)
+    if key not in _grounding:
+        if len(_grounding) >= 256:
+            _grounding.clear()
+        _grounding[key] = build_grounding(profile, question)
+    return _grounding[key]
+
+
+def build_grounding(profile: dict, question: str) -> str:
+    words = re.findall(r"\w+", question.lower())
+    phrases = set(words) | {" ".join(pair) for pair in zip(words, words[1:])}
+    index = profile["value_index"]
+
+    matches = {}
+    for phrase in phrases:
+        hits = index.get(phrase)
+        if hits is None and len(phrase) > 3:
+            close = closest_value(phrase, profile["trigram_index"])
+            hits = index[close] if close else None
+        for table, column, value in hits or []:
+            matches.setdefault((table, column), set()).add(value)
+
+    tables = {table for table, _ in matches}
+    for table, info in profile["tables"].items():
+        if table in phrases or table.rstrip("s") in phrases or phrases.intersection(info["columns"]):
+            tables.add(table)
+
+    lines = [
+        f"- {table}.{column} values: {', '.join(repr(v) for v in sorted(values, key=str))}"
+        for (table, column), values in sorted(matches.items())
+    ]
+    for table in sorted(tables):
+        for column, stats in profile["tables"][table]["columns"].items():
+            if (table, column) in matches or stats["type"] in NON_TEXT_TYPES:
+                continue
+            if stats.get("values") and stats.get("distinct", MAX_VALUES + 1) <= MAX_VALUES:
+                lines.append(f"- {table}.{column} allowed values: {', '.join(repr(v) for v in stats['values'][:10])}")
+
+    ordered = sorted(tables)
+    for i, start in enumerate(ordered):
+        for goal in ordered[i + 1:]:
+            path = join_path(profile["foreign_keys"], start, goal)
+            if path:
+                lines.append(f"- join {start} to {goal}: {' AND '.join(path)}")
+
+    return "\n".join(lines[:MAX_GROUNDING_LINES])
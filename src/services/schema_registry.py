@@ -0,0 +1,141 @@
+import logging
+import os
+import re
+import time
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SCHEMA_PREFIX = "ds_"
+SCHEMA_TTL_HOURS = float(os.getenv("SCHEMA_TTL_HOURS", "24"))
+TOUCH_INTERVAL_SECONDS = 60
+
+_last_touch: dict[str, float] = {}
+_registry_ready = False
+
+
+class SchemaNotLoaded(Exception):
+    pass
+
+
+def schema_name_for(session_id: str) -> str:
+    return SCHEMA_PREFIX + re.sub(r"[^a-z0-9]", "", session_id.lower())[:32]
+
+
+def session_schema(session_state) -> str:
+    if "schema_name" not in session_state:
+        session_state["schema_name"] = schema_name_for(uuid.uuid4().hex)
+    return session_state["schema_name"]
+
+
+def staging_schema_for(schema_name: str) -> str:
+    return f"{schema_name}__staging"
+
+
+def ensure_registry(conn):
+    # Created once per process in its own short transaction, so saves only
+    # wait on the lock of their own schema. The lock keeps concurrent
+    # CREATE TABLE IF NOT EXISTS from racing on the catalog.
+    global _registry_ready
+    if _registry_ready:
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('dataset_schemas'))")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS public.dataset_schemas (
+                schema_name TEXT PRIMARY KEY,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                last_used_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+    conn.commit()
+    _registry_ready = True
+
+
+def reader_role_for(schema_name: str) -> str:
+    return f"{schema_name}_reader"
+
+
+def grant_reader(cursor, schema_name: str):
+    # Chat queries run as this role, which can read the schema and nothing else.
+    role = reader_role_for(schema_name)
+    cursor.execute("SELECT 1 FROM pg_roles WHERE rolname = %s", (role,))
+    if cursor.fetchone() is None:
+        cursor.execute(f'CREATE ROLE "{role}" NOLOGIN')
+        cursor.execute(f'GRANT "{role}" TO CURRENT_USER')
+    cursor.execute(f'GRANT USAGE ON SCHEMA "{schema_name}" TO "{role}"')
+    cursor.execute(f'GRANT SELECT ON ALL TABLES IN SCHEMA "{schema_name}" TO "{role}"')
+    # Summaries are materialized after the save, outside this transaction.
+    cursor.execute(f'ALTER DEFAULT PRIVILEGES IN SCHEMA "{schema_name}" GRANT SELECT ON TABLES TO "{role}"')
+
+
+def lock_schema(cursor, schema_name: str):
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (schema_name,))
+
+
+def register_schema(cursor, schema_name: str):
+    cursor.execute("""
+        INSERT INTO public.dataset_schemas (schema_name) VALUES (%s)
+        ON CONFLICT (schema_name) DO UPDATE SET last_used_at = now()
+    """, (schema_name,))
+    _last_touch[schema_name] = time.monotonic()
+
+
+def touch_schema(conn, schema_name: str) -> bool:
+    # Returns whether the schema holds saved data that chat queries can read.
+    now = time.monotonic()
+    if now - _last_touch.get(schema_name, 0) < TOUCH_INTERVAL_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            # Schemas saved before reader roles existed cannot be queried until saved again.
+            cursor.execute(
+                "UPDATE public.dataset_schemas SET last_used_at = now() WHERE schema_name = %s AND to_regrole(%s) IS NOT NULL",
+                (schema_name, reader_role_for(schema_name))
+            )
+            loaded = cursor.rowcount > 0
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logging.warning(f"Could not update last use of schema {schema_name}: {e}")
+        return True
+    if loaded:
+        _last_touch[schema_name] = now
+    return loaded
+
+
+def collect_expired_schemas(conn, ttl_hours: float = SCHEMA_TTL_HOURS) -> list[str]:
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT schema_name FROM public.dataset_schemas WHERE last_used_at < now() - make_interval(secs => %s)",
+            (ttl_hours * 3600,)
+        )
+        expired = [row[0] for row in cursor.fetchall()]
+    conn.commit()
+
+    dropped = []
+    for schema_name in expired:
+        try:
+            with conn.cursor() as cursor:
+                # Schemas still being queried are skipped rather than waited on.
+                cursor.execute("SET LOCAL lock_timeout = '2s'")
+                lock_schema(cursor, schema_name)
+                cursor.execute(
+                    "DELETE FROM public.dataset_schemas WHERE schema_name = %s AND last_used_at < now() - make_interval(secs => %s)",
+                    (schema_name, ttl_hours * 3600)
+                )
+                deleted = cursor.rowcount
+                if deleted:
+                    cursor.execute(f'DROP SCHEMA IF EXISTS "{schema_name}" CASCADE')
+                    cursor.execute(f'DROP ROLE IF EXISTS "{reader_role_for(schema_name)}"')
+            conn.commit()
+            if deleted:
+                dropped.append(schema_name)
+        except Exception as e:
+            conn.rollback()
+            logging.warning(f"Could not drop expired schema {schema_name}: {e}")
+        _last_touch.pop(schema_name, None)
+    if dropped:
+        logging.info(f"Dropped expired schemas: {', '.join(dropped)}")
+    return dropped
@@ -0,0 +1,210 @@
+import hashlib
+import io
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+SYNC_TABLE = "_dataset_sync"
+
+
+@dataclass
+class TableSpec:
+    name: str
+    sql: str
+    columns: Dict[str, str]
+    constraints: List[str]
+    deferred_fks: List[str]
+    references: List[str]
+
+    @property
+    def definition(self) -> dict:
+        return {"columns": self.columns, "constraints": self.constraints, "deferred_fks": self.deferred_fks}
+
+    @property
+    def ddl_hash(self) -> str:
+        return hash_value(self.definition)
+
+
+@dataclass
+class SyncPlan:
+    # statements run before the TRUNCATE, post_truncate after it: ALTERs on
+    # tables with rows fail for NOT NULL columns and casts the new data never needs.
+    statements: List[str] = field(default_factory=list)
+    post_truncate: List[str] = field(default_factory=list)
+    truncate: List[str] = field(default_factory=list)
+    reload: List[str] = field(default_factory=list)
+    rebuild_reason: str | None = None
+
+    @property
+    def changes_ddl(self) -> bool:
+        return bool(self.statements or self.post_truncate)
+
+
+def hash_value(value) -> str:
+    payload = json.dumps(value, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def split_column_type(definition: str) -> tuple[str, str]:
+    parts = re.split(
+        r"\s+(?=(?:NOT\s+NULL|NULL|DEFAULT|PRIMARY\s+KEY|REFERENCES|UNIQUE|CHECK|GENERATED|CONSTRAINT|COLLATE)\b)",
+        definition.strip(), maxsplit=1, flags=re.IGNORECASE
+    )
+    return parts[0].strip().lower(), (parts[1].strip().lower() if len(parts) > 1 else "")
+
+
+def load_sync_state(cursor, schema_name: str) -> dict | None:
+    cursor.execute(
+        "SELECT 1 FROM information_schema.tables WHERE table_schema = %s AND table_name = %s",
+        (schema_name, SYNC_TABLE)
+    )
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute(f'SELECT object_name, kind, ddl_hash, data_hash, definition FROM "{schema_name}".{SYNC_TABLE}')
+    return {
+        name: {"kind": kind, "ddl_hash": ddl_hash, "data_hash": data_hash, "definition": definition}
+        for name, kind, ddl_hash, data_hash, definition in cursor.fetchall()
+    }
+
+
+def load_live_columns(cursor, schema_name: str) -> Dict[str, set]:
+    cursor.execute("""
+        SELECT c.table_name, c.column_name
+        FROM information_schema.columns c
+        JOIN information_schema.tables t ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+        WHERE c.table_schema = %s AND t.table_type = 'BASE TABLE' AND c.table_name <> %s
+    """, (schema_name, SYNC_TABLE))
+    live = {}
+    for table_name, column_name in cursor.fetchall():
+        live.setdefault(table_name, set()).add(column_name)
+    return live
+
+
+def plan_sync(specs: Dict[str, TableSpec], enums: Dict[str, str], data_hashes: Dict[str, str],
+              state: dict, live_columns: Dict[str, set]) -> SyncPlan:
+    plan = SyncPlan()
+    old_tables = {name: entry for name, entry in state.items() if entry["kind"] == "table"}
+    old_enums = {name: entry for name, entry in state.items() if entry["kind"] == "enum"}
+
+    if set(live_columns) != set(old_tables):
+        plan.rebuild_reason = "live tables differ from the last synced state"
+        return plan
+    for name, entry in old_tables.items():
+        if live_columns[name] != {column.lower() for column in entry["definition"]["columns"]}:
+            plan.rebuild_reason = f"columns of {name} were changed outside the sync"
+            return plan
+    for name, enum_sql in enums.items():
+        if name in old_enums and old_enums[name]["ddl_hash"] != hash_value(enum_sql):
+            plan.rebuild_reason = f"enum {name} changed"
+            return plan
+
+    created, altered = [], set()
+    alter_statements, deferred_statements = [], []
+    for name, spec in specs.items():
+        if name not in old_tables:
+            created.append(name)
+            deferred_statements.extend(spec.deferred_fks)
+            continue
+        if old_tables[name]["ddl_hash"] == spec.ddl_hash:
+            continue
+        old = old_tables[name]["definition"]
+        if old["constraints"] != spec.constraints or old["deferred_fks"] != spec.deferred_fks:
+            plan.rebuild_reason = f"constraints of {name} changed"
+            return plan
+        for column, definition in spec.columns.items():
+            if column not in old["columns"]:
+                alter_statements.append(f"ALTER TABLE {name} ADD COLUMN {column} {definition};")
+            elif old["columns"][column] != definition:
+                old_type, old_rest = split_column_type(old["columns"][column])
+                new_type, new_rest = split_column_type(definition)
+                if old_rest != new_rest:
+                    plan.rebuild_reason = f"column {name}.{column} constraints changed"
+                    return plan
+                alter_statements.append(
+                    f"ALTER TABLE {name} ALTER COLUMN {column} TYPE {new_type} USING {column}::{new_type};"
+                )
+        for column in old["columns"]:
+            if column not in spec.columns:
+                alter_statements.append(f"ALTER TABLE {name} DROP COLUMN {column};")
+        altered.add(name)
+
+    plan.statements.extend(sql for name, sql in enums.items() if name not in old_enums)
+    plan.statements.extend(f"DROP TABLE IF EXISTS {name} CASCADE;" for name in old_tables if name not in specs)
+    plan.statements.extend(specs[name].sql for name in created)
+    plan.post_truncate.extend(alter_statements)
+    plan.post_truncate.extend(deferred_statements)
+    plan.post_truncate.extend(f"DROP TYPE IF EXISTS {name} CASCADE;" for name in old_enums if name not in enums)
+
+    changed = set(created) | altered | {
+        name for name in specs
+        if name in old_tables and old_tables[name]["data_hash"] != data_hashes.get(name)
+    }
+    # Truncating a table empties every table referencing it, so those are reloaded too.
+    expanded = True
+    while expanded:
+        expanded = False
+        for name, spec in specs.items():
+            if name not in changed and changed.intersection(spec.references):
+                changed.add(name)
+                expanded = True
+
+    plan.reload = [name for name in specs if name in changed]
+    # Created tables are empty, but they still have to be truncated together
+    # with the existing tables they reference.
+    plan.truncate = list(plan.reload)
+    return plan
+
+
+def apply_sync_plan(cursor, plan: SyncPlan, tables: Dict[str, pa.Table]):
+    for statement in plan.statements:
+        cursor.execute(statement)
+    if plan.truncate:
+        cursor.execute(f"TRUNCATE {', '.join(plan.truncate)}")
+    for statement in plan.post_truncate:
+        cursor.execute(statement)
+    for table_name in plan.reload:
+        copy_table(cursor, table_name, tables.get(table_name))
+    logging.info(
+        f"Schema sync: {len(plan.statements) + len(plan.post_truncate)} DDL statements, reloaded {len(plan.reload)} tables: {', '.join(plan.reload) or 'none'}"
+    )
+
+
+def copy_table(cursor, table_name: str, table: pa.Table):
+    if table is None or table.num_rows == 0:
+        return
+    # Arrow quotes every string and leaves nulls unquoted and empty, which is
+    # exactly how COPY's CSV format tells NULL apart from ''.
+    sink = pa.BufferOutputStream()
+    pacsv.write_csv(table, sink, pacsv.WriteOptions(include_header=False))
+    cursor.copy_expert(
+        f"COPY {table_name} ({', '.join(table.column_names)}) FROM STDIN WITH (FORMAT csv)",
+        io.BytesIO(sink.getvalue().to_pybytes())
+    )
+
+
+def write_sync_state(cursor, schema_name: str, specs: Dict[str, TableSpec], enums: Dict[str, str],
+                     data_hashes: Dict[str, str]):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS "{schema_name}".{SYNC_TABLE} (
+            object_name TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            ddl_hash TEXT NOT NULL,
+            data_hash TEXT,
+            definition JSONB NOT NULL
+        )
+    """)
+    cursor.execute(f'TRUNCATE "{schema_name}".{SYNC_TABLE}')
+    records = [(name, "enum", hash_value(sql), None, json.dumps({"sql": sql})) for name, sql in enums.items()]
+    records += [
+        (name, "table", spec.ddl_hash, data_hashes.get(name), json.dumps(spec.definition))
+        for name, spec in specs.items()
+    ]
+    cursor.executemany(
+        f'INSERT INTO "{schema_name}".{SYNC_TABLE} (object_name, kind, ddl_hash, data_hash, definition) VALUES (%s, %s, %s, %s, %s)',
+        records
+    )
@@ -1,17 +1,52 @@
+import contextvars
+import hashlib
+import logging
+import os
+import threading
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
 from services.postgres_service import execute_sql
-from services.gemini_client import client
+from services.gemini_client import generate_content
+from services.metrics import timed, record_retry, stage
+from services.schema_profiler import grounding_context
+from services.aggregate_summaries import record_query
+from services.sql_guard import DEFAULT_ROW_LIMIT
+from services.schema_registry import SchemaNotLoaded
 from google.genai import types
-from langfuse.decorators import observe, langfuse_context
 from dotenv import load_dotenv
 load_dotenv()
 
-@observe(as_type="generation")
-def generate_sql(ddl_schema: str, input_query: str, error: str, messages: str) -> str:
-    if error != 'first run' and error is not None:
+SQL_CANDIDATES = int(os.getenv("SQL_CANDIDATES", "1"))
+SQL_CANDIDATE_SELECTION = os.getenv("SQL_CANDIDATE_SELECTION", "first")
+SQL_CANDIDATE_TIMEOUT_MS = int(os.getenv("SQL_CANDIDATE_TIMEOUT_MS", "5000"))
+SQL_MAX_REPAIRS = int(os.getenv("SQL_MAX_REPAIRS", "3"))
+CANDIDATE_TEMPERATURES = [0.0, 0.4, 0.7, 1.0]
+
+_candidate_pool: ThreadPoolExecutor | None = None
+_candidate_pool_lock = threading.Lock()
+
+
+class SqlRepairFailed(Exception):
+    pass
+
+@timed("generate_sql")
+def generate_sql(ddl_schema: str, input_query: str, error: str, messages: str, schema_name: str,
+                 temperature: float = 0.0) -> str:
+    grounding = grounding_context(schema_name, input_query)
+    grounding_section = f"""
+        Relevant values and join paths from the data (use these exact spellings):
+{grounding}
+""" if grounding else ""
+    repair = error != 'first run' and error is not None
+    if repair:
+        record_retry()
         prompt = f"""
         You previously generated an invalid SQL query with the following error: {error}
         Please correct it based on the schema: {ddl_schema}
         And user question: {input_query}
+        {grounding_section}
 
         Guidelines:
         - Output only a valid SQL query.
@@ -30,6 +65,7 @@ def generate_sql(ddl_schema: str, input_query: str, error: str, messages: str) -
 
         User request:
         \"{input_query}\"
+        {grounding_section}
 
         Guidelines:
         - Output only a valid SQL query.
@@ -48,21 +84,17 @@ def generate_sql(ddl_schema: str, input_query: str, error: str, messages: str) -
             )
     gemini_messages.append(types.Content(role="user", parts=[types.Part(text=prompt)]))
     model = "gemini-2.0-flash"
-    response = client.models.generate_content(
+    response = generate_content(
+        "generate_sql",
         model=model,
         contents=gemini_messages,
         config={
-            "temperature": 0.0
-        }
+            "temperature": temperature
+        },
+        # A repair prompt only carries the latest error, so a cached answer
+        # would repeat the failed query when the same error comes back.
+        reusable=not repair
     )
-    langfuse_context.update_current_observation(
-    input=input,
-    model=model,
-    usage_details={
-          "input": response.usage_metadata.prompt_token_count,
-          "output": response.usage_metadata.candidates_token_count,
-          "total": response.usage_metadata.total_token_count
-      })
     raw = response.text.strip()
 
     if raw.startswith("```sql"):
@@ -72,13 +104,90 @@ def generate_sql(ddl_schema: str, input_query: str, error: str, messages: str) -
 
     return raw
 
-def sql_generation(ddl_schema: str, user_query: str, messages: str) -> dict:
+def sql_generation(ddl_schema: str, user_query: str, messages: str, schema_name: str,
+                   row_limit: int = DEFAULT_ROW_LIMIT) -> dict:
     error = 'first run'
+    if SQL_CANDIDATES > 1:
+        sql_query, result_df, error = generate_candidates(
+            ddl_schema, user_query, messages, schema_name, SQL_CANDIDATES, row_limit
+        )
+    repairs = 0
     while error:
-        sql_query = generate_sql(ddl_schema, user_query, error, messages) 
-        result_df, error = execute_sql(sql_query)
+        if error != 'first run':
+            if repairs == SQL_MAX_REPAIRS:
+                raise SqlRepairFailed(f"No working SQL query after {SQL_MAX_REPAIRS} repair attempts. Last error: {error}")
+            repairs += 1
+        sql_query = generate_sql(ddl_schema, user_query, error, messages, schema_name)
+        result_df, error = execute_sql(sql_query, schema_name, row_limit=row_limit)
+    record_query(sql_query, schema_name)
     return sql_query, result_df
 
+def get_candidate_pool() -> ThreadPoolExecutor:
+    global _candidate_pool
+    with _candidate_pool_lock:
+        if _candidate_pool is None:
+            _candidate_pool = ThreadPoolExecutor(max_workers=2 * SQL_CANDIDATES, thread_name_prefix="sql-candidate")
+        return _candidate_pool
+
+def run_candidate(ddl_schema: str, user_query: str, messages: str, schema_name: str, temperature: float,
+                  row_limit: int = DEFAULT_ROW_LIMIT):
+    sql_query = generate_sql(ddl_schema, user_query, 'first run', messages, schema_name, temperature)
+    result_df, error = execute_sql(sql_query, schema_name, timeout_ms=SQL_CANDIDATE_TIMEOUT_MS, row_limit=row_limit)
+    return sql_query, result_df, error
+
+def result_fingerprint(df: pd.DataFrame) -> str:
+    # Row order and column names are ignored, so candidates that differ only
+    # in ORDER BY or aliases still agree.
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    except TypeError:
+        row_hashes = pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+    row_hashes.sort()
+    return hashlib.sha256(row_hashes.tobytes()).hexdigest()
+
+def generate_candidates(ddl_schema: str, user_query: str, messages: str, schema_name: str, count: int,
+                        row_limit: int = DEFAULT_ROW_LIMIT):
+    pool = get_candidate_pool()
+    with stage("sql_candidates"):
+        futures = {
+            pool.submit(
+                contextvars.copy_context().run, run_candidate,
+                ddl_schema, user_query, messages, schema_name, CANDIDATE_TEMPERATURES[i % len(CANDIDATE_TEMPERATURES)],
+                row_limit
+            ): i
+            for i in range(count)
+        }
+        results = {}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    results[futures[future]] = future.result()
+                except SchemaNotLoaded:
+                    raise
+                except Exception as e:
+                    logging.warning(f"SQL candidate {futures[future]} failed: {e}")
+                    results[futures[future]] = (None, None, str(e))
+            if SQL_CANDIDATE_SELECTION == "first":
+                successes = [i for i in sorted(results) if results[i][2] is None]
+                if successes:
+                    # Slower candidates keep running in the pool, bounded by the statement timeout.
+                    for future in pending:
+                        future.cancel()
+                    logging.info(f"Using SQL candidate {successes[0]} of {count}")
+                    return results[successes[0]]
+
+    successes = [i for i in sorted(results) if results[i][2] is None]
+    if not successes:
+        logging.info(f"All {count} SQL candidates failed, repairing the first one")
+        return results[0]
+    fingerprints = {i: result_fingerprint(results[i][1]) for i in successes}
+    votes = Counter(fingerprints.values())
+    winner = next(i for i in successes if votes[fingerprints[i]] == max(votes.values()))
+    logging.info(f"Using SQL candidate {winner} of {count} ({max(votes.values())} of {len(successes)} agree)")
+    return results[winner]
+
 sql_generation_declaration={
         "name": "sql_generation",
         "description": "Generate and run SQL query from user input",
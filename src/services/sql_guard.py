@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+from sqlalchemy import text
+from dotenv import load_dotenv
+
+from services.schema_registry import reader_role_for
+
+load_dotenv()
+
+MAX_PLAN_COST = float(os.getenv("SQL_MAX_PLAN_COST", "10000000"))
+MAX_PLAN_ROWS = float(os.getenv("SQL_MAX_PLAN_ROWS", "5000000"))
+DEFAULT_ROW_LIMIT = int(os.getenv("SQL_DEFAULT_LIMIT", "10000"))
+# Plots are reduced before rendering, so they can read far more rows than a table preview.
+PLOT_ROW_LIMIT = int(os.getenv("SQL_PLOT_LIMIT", "500000"))
+STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", "15000"))
+
+WRITE_NODES = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter,
+    exp.Into, exp.Lock, exp.Command, exp.Set, exp.Copy, exp.TruncateTable
+)
+
+SYSTEM_SCHEMAS = {"public", "information_schema", "pg_catalog", "pg_toast"}
+# Functions sqlglot does not model are only allowed from this list. Postgres
+# has many functions that run SQL text (ts_stat, query_to_xml), read files or
+# change settings, so a denylist can never be complete; functions sqlglot
+# does model are standard scalar, aggregate and window functions.
+ALLOWED_FUNCTIONS = {
+    # math
+    "abs", "cbrt", "ceil", "ceiling", "degrees", "div", "exp", "factorial", "floor", "gcd", "greatest", "lcm",
+    "least", "ln", "log", "log10", "mod", "pi", "power", "radians", "random", "round", "scale", "sign", "sqrt",
+    "trunc", "width_bucket", "sin", "cos", "tan", "asin", "acos", "atan", "atan2",
+    # strings
+    "ascii", "btrim", "char_length", "character_length", "chr", "concat", "concat_ws", "format", "initcap",
+    "left", "length", "lower", "lpad", "ltrim", "md5", "octet_length", "position", "regexp_match",
+    "regexp_matches", "regexp_replace", "regexp_split_to_array", "regexp_split_to_table", "repeat", "replace",
+    "reverse", "right", "rpad", "rtrim", "split_part", "starts_with", "string_to_array", "array_to_string",
+    "strpos", "substr", "substring", "to_char", "to_number", "translate", "trim", "upper",
+    # dates and times
+    "age", "clock_timestamp", "current_date", "date_bin", "date_part", "date_trunc", "isfinite",
+    "justify_days", "justify_hours", "justify_interval", "make_date", "make_interval", "make_time",
+    "make_timestamp", "make_timestamptz", "now", "timezone", "to_date", "to_timestamp",
+    # conditionals
+    "coalesce", "nullif",
+    # aggregates
+    "array_agg", "avg", "bit_and", "bit_or", "bool_and", "bool_or", "corr", "count", "covar_pop", "covar_samp",
+    "every", "json_agg", "json_object_agg", "jsonb_agg", "jsonb_object_agg", "max", "min", "mode",
+    "percentile_cont", "percentile_disc", "regr_count", "regr_intercept", "regr_r2", "regr_slope", "stddev",
+    "stddev_pop", "stddev_samp", "string_agg", "sum", "var_pop", "var_samp", "variance",
+    # window functions
+    "cume_dist", "dense_rank", "first_value", "lag", "last_value", "lead", "nth_value", "ntile", "percent_rank",
+    "rank", "row_number",
+    # arrays and JSON
+    "array_append", "array_cat", "array_length", "array_lower", "array_position", "array_remove", "array_upper",
+    "cardinality", "unnest", "json_array_elements", "json_array_elements_text", "json_array_length",
+    "json_build_array", "json_build_object", "json_each", "json_extract_path", "json_extract_path_text",
+    "json_object_keys", "json_typeof", "jsonb_array_elements", "jsonb_array_elements_text", "jsonb_array_length",
+    "jsonb_build_array", "jsonb_build_object", "jsonb_each", "jsonb_extract_path", "jsonb_extract_path_text",
+    "jsonb_object_keys", "jsonb_typeof", "to_json", "to_jsonb",
+    # series and text search
+    "generate_series", "plainto_tsquery", "to_tsquery", "to_tsvector", "ts_rank", "websearch_to_tsquery",
+}
+
+
+class SqlRejected(Exception):
+    pass
+
+
+def identifier_name(node: exp.Expression | None) -> str:
+    if not isinstance(node, exp.Identifier):
+        return ""
+    # Postgres folds unquoted identifiers to lower case.
+    return node.name if node.quoted else node.name.lower()
+
+
+def check_scope(statement: exp.Expression, schema_name: str):
+    for table in statement.find_all(exp.Table):
+        schema = identifier_name(table.args.get("db"))
+        if schema and schema != schema_name:
+            if schema in SYSTEM_SCHEMAS or schema.startswith("pg_"):
+                raise SqlRejected(f"Query rejected: the {schema} schema is not accessible.")
+            raise SqlRejected(f"Query rejected: only tables of the current dataset can be queried, not {schema}.{table.name}.")
+        # pg_catalog is searched implicitly, and views like pg_stats expose other schemas' values.
+        if not schema and table.name.lower().startswith("pg_"):
+            raise SqlRejected(f"Query rejected: system catalog {table.name} is not accessible.")
+    for function in statement.find_all(exp.Anonymous, exp.AnonymousAggFunc):
+        if function.name.lower() not in ALLOWED_FUNCTIONS:
+            raise SqlRejected(f"Query rejected: function {function.name} is not allowed.")
+
+
+def prepare_query(query: str, schema_name: str, row_limit: int = DEFAULT_ROW_LIMIT) -> tuple[str, int | None]:
+    # Returns the query to run and the row limit injected into it, if any.
+    # The injected LIMIT fetches one extra row so a truncated result can be told apart.
+    query = query.strip().rstrip(";").strip()
+    try:
+        statements = [s for s in sqlglot.parse(query, read="postgres") if s is not None]
+    except ParseError as e:
+        # Without a parse tree the tables a query reads cannot be checked against the caller's schema.
+        raise SqlRejected(f"Query rejected: the SQL could not be parsed ({e}).") from e
+
+    if len(statements) != 1:
+        raise SqlRejected("Query rejected: exactly one SQL statement is allowed.")
+    statement = statements[0]
+    if not isinstance(statement, exp.Query):
+        raise SqlRejected(f"Query rejected: only read-only SELECT queries are allowed, got {statement.key.upper()}.")
+    for node in statement.find_all(*WRITE_NODES):
+        raise SqlRejected(f"Query rejected: {node.key.upper()} is not allowed, the database is read-only.")
+    check_scope(statement, schema_name)
+
+    if statement.args.get("limit") is None:
+        return f"{query}\nLIMIT {row_limit + 1}", row_limit
+    return query, None
+
+
+def begin_guarded_transaction(conn, timeout_ms: int = STATEMENT_TIMEOUT_MS):
+    conn.execute(text("SET TRANSACTION READ ONLY"))
+    conn.execute(text("SELECT set_config('statement_timeout', :timeout, true)"), {"timeout": str(timeout_ms)})
+
+
+def restrict_to_schema(conn, schema_name: str):
+    # The checks above work on the query text; the role makes Postgres itself
+    # refuse anything outside the session's schema. SET LOCAL ends with the transaction.
+    conn.execute(text(f'SET LOCAL ROLE "{reader_role_for(schema_name)}"'))
+
+
+def check_plan(conn, query: str):
+    plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {query}").scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]["Plan"]
+    cost, rows = root["Total Cost"], root["Plan Rows"]
+    logging.info(f"Query plan estimate: cost={cost}, rows={rows}")
+    if cost > MAX_PLAN_COST:
+        raise SqlRejected(
+            f"Query rejected: estimated cost {cost:.0f} exceeds the limit of {MAX_PLAN_COST:.0f}. "
+            "Add join conditions, WHERE filters or aggregation so less data is scanned."
+        )
+    if rows > MAX_PLAN_ROWS:
+        raise SqlRejected(
+            f"Query rejected: estimated {rows:.0f} result rows exceed the limit of {MAX_PLAN_ROWS:.0f}. "
+            "Aggregate or filter the result."
+        )
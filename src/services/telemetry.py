@@ -0,0 +1,169 @@
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+from services.langfuse_client import langfuse_enabled, get_langfuse
+
+load_dotenv()
+
+SAMPLE_RATE = float(os.getenv("TELEMETRY_SAMPLE_RATE", "1.0"))
+MAX_FIELD_CHARS = int(os.getenv("TELEMETRY_MAX_FIELD_CHARS", "8000"))
+QUEUE_SIZE = int(os.getenv("TELEMETRY_QUEUE_SIZE", "1000"))
+BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "50"))
+FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "2.0"))
+
+_STOP = object()
+
+
+def truncate(text: str | None, limit: int = MAX_FIELD_CHARS) -> str | None:
+    if text is None or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [truncated {len(text) - limit} chars]"
+
+
+def contents_to_text(contents) -> str:
+    if isinstance(contents, str):
+        return contents
+    lines = []
+    for content in contents:
+        if isinstance(content, str):
+            lines.append(content)
+            continue
+        role = getattr(content, "role", None) or "user"
+        text = "".join(part.text or "" for part in (content.parts or []))
+        lines.append(f"{role}: {text}")
+    return "\n\n".join(lines)
+
+
+def response_to_text(response) -> str | None:
+    try:
+        parts = response.candidates[0].content.parts or []
+    except (AttributeError, IndexError, TypeError):
+        return None
+    chunks = []
+    for part in parts:
+        if part.text:
+            chunks.append(part.text)
+        elif part.function_call:
+            chunks.append(f"{part.function_call.name}({dict(part.function_call.args or {})})")
+    return "".join(chunks)
+
+
+def model_parameters(config) -> dict:
+    if config is None:
+        return {}
+    if isinstance(config, dict):
+        items = config.items()
+    else:
+        items = ((key, getattr(config, key, None)) for key in ("temperature", "max_output_tokens", "candidate_count"))
+    return {key: value for key, value in items if key in ("temperature", "max_output_tokens", "candidate_count") and value is not None}
+
+
+class TelemetryWorker:
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._langfuse = None
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="telemetry-worker", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def submit(self, item: dict):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def shutdown(self, timeout: float = 5.0):
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            stop = first is _STOP
+            if not stop:
+                batch.append(first)
+            while not stop and len(batch) < self._batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+            if batch:
+                self._send(batch)
+            if stop:
+                return
+
+    def _send(self, batch: list[dict]):
+        try:
+            if self._langfuse is None:
+                self._langfuse = get_langfuse()
+            for item in batch:
+                self._langfuse.generation(**build_generation(**item))
+            self._langfuse.flush()
+        except Exception as e:
+            logging.warning(f"Telemetry flush failed, dropped {len(batch)} observations: {e}")
+
+
+def build_generation(name, model, contents, config, response, start_time, end_time) -> dict:
+    from services.gemini_client import usage_details
+
+    return {
+        "name": name,
+        "model": model,
+        "model_parameters": model_parameters(config),
+        "input": truncate(contents_to_text(contents)),
+        "output": truncate(response_to_text(response)),
+        "usage_details": usage_details(response),
+        "start_time": start_time,
+        "end_time": end_time,
+    }
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker() -> TelemetryWorker:
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = TelemetryWorker(QUEUE_SIZE, BATCH_SIZE, FLUSH_INTERVAL)
+    return _worker
+
+
+if langfuse_enabled and SAMPLE_RATE > 0:
+    def record_generation(name: str, model: str, contents, config, response, start_time: datetime):
+        if SAMPLE_RATE < 1.0 and random.random() >= SAMPLE_RATE:
+            return
+        get_worker().submit({
+            "name": name,
+            "model": model,
+            "contents": contents,
+            "config": config,
+            "response": response,
+            "start_time": start_time,
+            "end_time": datetime.now(timezone.utc),
+        })
+else:
+    def record_generation(name: str, model: str, contents, config, response, start_time: datetime):
+        pass
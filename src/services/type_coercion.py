@@ -0,0 +1,125 @@
+import json
+import re
+from dataclasses import dataclass
+from typing import Dict, List
+
+import pandas as pd
+import pyarrow as pa
+
+from services.schema_sync import TableSpec, split_column_type
+
+INT_TYPES = {"int", "integer", "bigint", "smallint", "tinyint", "mediumint", "serial", "bigserial", "smallserial", "int2", "int4", "int8"}
+FLOAT_TYPES = {"decimal", "numeric", "float", "double", "real", "float4", "float8"}
+DATETIME_TYPES = {"timestamp", "timestamptz", "datetime", "date"}
+BOOL_TYPES = {"bool", "boolean"}
+STRING_TYPES = {"varchar", "char", "character", "text", "nvarchar", "nchar"}
+JSON_TYPES = {"json", "jsonb"}
+TRUE_VALUES = {"true", "t", "yes", "y", "1", "on"}
+FALSE_VALUES = {"false", "f", "no", "n", "0", "off"}
+MAX_EXAMPLES = 3
+# A UTC offset after the time part; the time is captured so the offset alone can be removed.
+TIME_ZONE = re.compile(r"(\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)\s*(?:[zZ]|[+-]\d{2}(?::?\d{2})?)$")
+
+
+@dataclass
+class ColumnRejects:
+    table: str
+    column: str
+    column_type: str
+    count: int
+    examples: list
+
+    def __str__(self) -> str:
+        examples = ", ".join(repr(value) for value in self.examples)
+        return f"{self.table}.{self.column} ({self.column_type}): {self.count} rejected, e.g. {examples}"
+
+
+class CoercionError(Exception):
+    def __init__(self, rejects: List[ColumnRejects]):
+        self.rejects = rejects
+        super().__init__("Generated data does not match the DDL column types:\n" + "\n".join(str(r) for r in rejects))
+
+
+def parse_enum_values(enum_sql: str) -> List[str]:
+    body = enum_sql[enum_sql.index("(") + 1:enum_sql.rindex(")")]
+    return [value.replace("''", "'") for value in re.findall(r"'((?:[^']|'')*)'", body)]
+
+
+def coerce_column(series: pd.Series, column_type: str, enum_values: Dict[str, List[str]]) -> pd.Series:
+    base = column_type.split("(")[0].split()[0] if column_type else ""
+
+    if base in enum_values:
+        return pd.Series(pd.Categorical(series.astype("string"), categories=enum_values[base]), index=series.index)
+    if base in INT_TYPES:
+        numbers = pd.to_numeric(series, errors="coerce")
+        return numbers.where(numbers % 1 == 0).astype("Int64")
+    if base in FLOAT_TYPES or column_type.startswith("double precision"):
+        return pd.to_numeric(series, errors="coerce").astype("float64")
+    if base in DATETIME_TYPES:
+        with_tz = base == "timestamptz" or "with time zone" in column_type
+        if series.dtype != object:
+            return parse_datetimes(series, with_tz)
+        text = series.astype("string")
+        zoned = text.str.extract(TIME_ZONE)[0].notna()
+        if not with_tz:
+            # Postgres ignores the offset given for a timestamp without time zone or a date.
+            return parse_datetimes(series.where(~zoned, text.str.replace(TIME_ZONE, r"\1", regex=True)), False)
+        if zoned.any() and not zoned.all():
+            # pandas would apply the first value's offset to the values without one.
+            return pd.concat([parse_datetimes(series[zoned], True), parse_datetimes(series[~zoned], True)]).reindex(series.index)
+        return parse_datetimes(series, True)
+    if base in BOOL_TYPES:
+        lowered = series.astype("string").str.strip().str.lower()
+        return lowered.map(lambda v: True if v in TRUE_VALUES else False if v in FALSE_VALUES else pd.NA).astype("boolean")
+    if base in JSON_TYPES:
+        return series.map(lambda v: json.dumps(v) if isinstance(v, (dict, list)) else v).astype("string")
+    if base in STRING_TYPES:
+        text = series.astype("string")
+        length = re.search(r"\((\d+)\)", column_type)
+        if length and base != "text":
+            text = text.where(text.str.len() <= int(length.group(1)))
+        return text
+    return series.astype("string")
+
+
+def parse_datetimes(series: pd.Series, with_tz: bool) -> pd.Series:
+    parsed = pd.to_datetime(series, errors="coerce", format="ISO8601", utc=with_tz)
+    fallback = parsed.isna() & series.notna()
+    if fallback.any():
+        parsed[fallback] = pd.to_datetime(series[fallback], errors="coerce", format="mixed", utc=with_tz)
+    return parsed
+
+
+def coerce_table(spec: TableSpec, table: pa.Table | None, enum_values: Dict[str, List[str]]) -> tuple[pd.DataFrame, List[ColumnRejects]]:
+    df = table.to_pandas() if table is not None else pd.DataFrame()
+    if df.empty:
+        return df, []
+    df.columns = [str(column).lower() for column in df.columns]
+
+    rejects = []
+    for column in df.columns:
+        original = df[column]
+        present = original.notna()
+        if column not in spec.columns:
+            examples = original[present].head(MAX_EXAMPLES).tolist()
+            rejects.append(ColumnRejects(spec.name, column, "unknown column", int(present.sum()), examples))
+            continue
+        column_type, _ = split_column_type(spec.columns[column])
+        coerced = coerce_column(original, column_type, enum_values)
+        rejected = present & coerced.isna()
+        if rejected.any():
+            examples = original[rejected].head(MAX_EXAMPLES).tolist()
+            rejects.append(ColumnRejects(spec.name, column, column_type, int(rejected.sum()), examples))
+        df[column] = coerced
+    return df, rejects
+
+
+def coerce_dataset(specs: Dict[str, TableSpec], enums: Dict[str, str], data_by_table: Dict[str, pa.Table]) -> Dict[str, pa.Table]:
+    enum_values = {name: parse_enum_values(sql) for name, sql in enums.items()}
+    frames, rejects = {}, []
+    for name, spec in specs.items():
+        frames[name], table_rejects = coerce_table(spec, data_by_table.get(name), enum_values)
+        rejects.extend(table_rejects)
+    if rejects:
+        raise CoercionError(rejects)
+    return {name: pa.Table.from_pandas(df, preserve_index=False) for name, df in frames.items()}
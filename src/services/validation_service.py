@@ -2,7 +2,8 @@ import json
 import logging
 from google.genai import types
 from typing import List
-from services.gemini_client import client
+from services.gemini_client import generate_content
+from services.metrics import timed
 
 
 def extract_affected_tables(prompt: str, table_names: List[str]) -> List[str]:
@@ -22,7 +23,8 @@ def extract_affected_tables(prompt: str, table_names: List[str]) -> List[str]:
         types.Content(parts=[types.Part(text=user_prompt)], role="user")
     ]
 
-    response = client.models.generate_content(
+    response = generate_content(
+        "extract_affected_tables",
         model="gemini-2.0-flash",
         contents=contents,
         config=types.GenerateContentConfig(
@@ -42,6 +44,7 @@ def extract_affected_tables(prompt: str, table_names: List[str]) -> List[str]:
 
 
 
+@timed("validate_prompt")
 def validate_prompt(prompt: str, ddl_schema: str) -> str:
     full_prompt = f"""
 You are a strict security validator for a database data assistant system.
@@ -67,7 +70,8 @@ DDL shcema to verify content of the data:
         types.Content(parts=[types.Part(text=full_prompt)], role="user")
     ]
 
-    response = client.models.generate_content(
+    response = generate_content(
+        "validate_prompt",
         model="gemini-2.0-flash",
         contents=contents,
         config=types.GenerateContentConfig(
@@ -0,0 +1,6 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+# genai.Client refuses to construct without credentials; the tests never call the API.
+os.environ.setdefault("GOOGLE_API_KEY", "offline-tests")
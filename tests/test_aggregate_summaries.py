@@ -0,0 +1,97 @@
+import pytest
+
+from services.aggregate_summaries import Summary, analyze, rewrite
+
+
+def summary_for(pattern, extra_keys=(), types=None):
+    return Summary("_agg_x", sorted(pattern.keys + list(extra_keys)), pattern.parts, types or {})
+
+
+def test_analyze_collects_group_and_filter_keys():
+    pattern = analyze("SELECT region, COUNT(*) FROM orders WHERE status = 'paid' GROUP BY region")
+    assert pattern.source == "FROM orders"
+    assert pattern.tables == ["orders"]
+    assert pattern.keys == ["region", "status"]
+    assert pattern.parts == ["COUNT(*)"]
+
+
+def test_avg_is_stored_as_sum_and_count():
+    pattern = analyze("SELECT region, AVG(amount) FROM orders GROUP BY region")
+    assert pattern.parts == ["COUNT(amount)", "SUM(amount)"]
+    rewritten = rewrite(pattern, summary_for(pattern, types={"p1": "double precision"}), ["region", "avg"], "ds_a")
+    assert rewritten == (
+        'SELECT k0 AS "region", (CAST(SUM(p1) AS DOUBLE PRECISION) / NULLIF(SUM(p0), 0)) AS "avg" '
+        'FROM "ds_a"."_agg_x" GROUP BY k0'
+    )
+
+
+def test_coarser_grouping_re_aggregates_a_finer_summary():
+    pattern = analyze("SELECT region, SUM(amount) AS total FROM orders GROUP BY region")
+    rewritten = rewrite(pattern, summary_for(pattern, extra_keys=["product"]), ["region", "total"], "ds_a")
+    assert rewritten == 'SELECT k1 AS "region", (SUM(p0)) AS "total" FROM "ds_a"."_agg_x" GROUP BY k1'
+
+
+def test_sum_keeps_the_summary_column_type():
+    pattern = analyze("SELECT region, SUM(amount) AS total FROM orders GROUP BY region")
+    rewritten = rewrite(pattern, summary_for(pattern, types={"p0": "numeric"}), ["region", "total"], "ds_a")
+    assert '(CAST(SUM(p0) AS DECIMAL)) AS "total"' in rewritten
+
+
+def test_where_and_having_are_rewritten():
+    pattern = analyze("SELECT region, COUNT(*) FROM orders WHERE status = 'paid' GROUP BY region HAVING COUNT(*) > 10")
+    rewritten = rewrite(pattern, summary_for(pattern), ["region", "count"], "ds_a")
+    assert rewritten == (
+        'SELECT k0 AS "region", (CAST(SUM(p0) AS BIGINT)) AS "count" FROM "ds_a"."_agg_x" '
+        "WHERE k1 = 'paid' GROUP BY k0 HAVING (CAST(SUM(p0) AS BIGINT)) > 10"
+    )
+
+
+def test_order_by_alias_and_limit_are_kept():
+    pattern = analyze("SELECT region, SUM(amount) AS total FROM orders GROUP BY region ORDER BY total DESC LIMIT 5")
+    rewritten = rewrite(pattern, summary_for(pattern), ["region", "total"], "ds_a")
+    assert rewritten.endswith("GROUP BY k0 ORDER BY total DESC LIMIT 5")
+
+
+def test_order_by_aggregate_is_rewritten():
+    pattern = analyze("SELECT region, SUM(amount) FROM orders GROUP BY region ORDER BY MAX(created_at)")
+    assert pattern.parts == ["MAX(created_at)", "SUM(amount)"]
+    rewritten = rewrite(pattern, summary_for(pattern), ["region", "sum"], "ds_a")
+    assert rewritten.endswith("GROUP BY k0 ORDER BY (MAX(p0))")
+
+
+def test_positional_group_by_over_a_join():
+    pattern = analyze(
+        "SELECT c.region, MIN(o.amount), MAX(o.amount) FROM orders o JOIN customers c ON c.id = o.customer_id GROUP BY 1"
+    )
+    assert pattern.tables == ["orders", "customers"]
+    assert pattern.keys == ["c.region"]
+    rewritten = rewrite(pattern, summary_for(pattern), ["region", "min", "max"], "ds_a")
+    assert rewritten == 'SELECT k0 AS "region", (MIN(p1)) AS "min", (MAX(p0)) AS "max" FROM "ds_a"."_agg_x" GROUP BY k0'
+
+
+def test_summary_missing_a_part_is_not_used():
+    pattern = analyze("SELECT region, MIN(amount) FROM orders GROUP BY region")
+    summary = Summary("_agg_x", ["region"], ["SUM(amount)"], {})
+    assert rewrite(pattern, summary, ["region", "min"], "ds_a") is None
+
+
+def test_summary_missing_a_filter_key_is_not_used():
+    pattern = analyze("SELECT region, SUM(amount) FROM orders WHERE status = 'paid' GROUP BY region")
+    summary = Summary("_agg_x", ["region"], pattern.parts, {})
+    assert rewrite(pattern, summary, ["region", "sum"], "ds_a") is None
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT SUM(amount) FROM orders",
+    "SELECT region, COUNT(DISTINCT customer_id) FROM orders GROUP BY region",
+    "SELECT region, SUM(amount) OVER () FROM orders GROUP BY region",
+    "SELECT region, string_agg(name, ',') FROM orders GROUP BY region",
+    "SELECT region, SUM(amount) FROM ds_x.orders GROUP BY region",
+    "WITH t AS (SELECT * FROM orders) SELECT region, SUM(amount) FROM t GROUP BY region",
+    "SELECT region, SUM(amount) FROM (SELECT * FROM orders) AS o GROUP BY region",
+    "SELECT DISTINCT region, SUM(amount) FROM orders GROUP BY region",
+    "SELECT region, SUM(amount) FROM orders GROUP BY ROLLUP (region)",
+    "SELECT region, SUM(amount) FROM orders GROUP BY region ORDER BY customer_id",
+])
+def test_unsupported_shapes_are_not_candidates(query):
+    assert analyze(query) is None
@@ -0,0 +1,60 @@
+import json
+
+import pyarrow as pa
+import pytest
+
+from services import dataset_store
+from services.dataset_store import Dataset, load_dataset
+
+
+@pytest.fixture(autouse=True)
+def dataset_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_store, "DATASET_DIR", str(tmp_path))
+    monkeypatch.setattr(dataset_store, "_collected", True)
+    monkeypatch.setattr(dataset_store, "_versions", {})
+    monkeypatch.setattr(dataset_store, "_loaded", dataset_store.OrderedDict())
+
+
+def names(*values):
+    return pa.table({"name": list(values)})
+
+
+def test_edit_shares_unchanged_tables():
+    base = Dataset({"t": names("a"), "u": names("x")})
+    edited = base.with_tables({"t": names("b")})
+    assert edited.version == 1 and edited.parent is base
+    assert edited.table("u") is base.table("u")
+    assert edited.table_key("u") == base.table_key("u")
+    assert edited.table_key("t") != base.table_key("t")
+
+
+def test_edit_after_undo_gets_a_new_version():
+    base = Dataset({"t": names("a")})
+    base.save()
+    discarded = base.with_tables({"t": names("b")})
+    discarded_path = discarded.save()
+
+    # Undo goes back to the parent; the next edit must not reuse the discarded version.
+    edited = discarded.parent.with_tables({"t": names("c")})
+    edited_path = edited.save()
+
+    assert edited.version > discarded.version
+    assert edited.table_key("t") != discarded.table_key("t")
+    assert edited_path != discarded_path
+    with open(discarded_path) as f:
+        assert json.load(f)["version"] == discarded.version
+
+
+def test_versions_saved_before_a_restart_are_not_reused():
+    base = Dataset({"t": names("a")})
+    base.save()
+    discarded_path = base.with_tables({"t": names("b")}).save()
+
+    dataset_store._versions.clear()
+    dataset_store._loaded.clear()
+    edited = load_dataset(base.path).with_tables({"t": names("c")})
+    edited.save()
+
+    assert edited.version == 2
+    assert load_dataset(discarded_path).table("t").column("name").to_pylist() == ["b"]
+    assert load_dataset(edited.path).table("t").column("name").to_pylist() == ["c"]
@@ -0,0 +1,41 @@
+import pytest
+from google.genai import types
+
+from services import llm_cache
+
+
+def response(text):
+    return types.GenerateContentResponse(candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))])
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "_initialized", False)
+    return monkeypatch
+
+
+def contents(text):
+    return [types.Content(role="user", parts=[types.Part(text=text)])]
+
+
+def test_deterministic_requests_are_reused(cache):
+    cache.setattr(llm_cache, "LLM_CACHE_MODE", "readwrite")
+    llm_cache.store("m", contents("q"), {"temperature": 0}, response("SELECT 1"))
+    assert llm_cache.lookup("generate_sql", "m", contents("q"), {"temperature": 0}).text == "SELECT 1"
+    assert llm_cache.lookup("generate_sql", "m", contents("q"), {"temperature": 0.7}) is None
+
+
+def test_repair_prompts_are_not_reused(cache):
+    cache.setattr(llm_cache, "LLM_CACHE_MODE", "readwrite")
+    llm_cache.store("m", contents("repair"), {"temperature": 0}, response("SELECT bad"), reusable=False)
+    assert llm_cache.lookup("generate_sql", "m", contents("repair"), {"temperature": 0}) is None
+    llm_cache.store("m", contents("repair"), {"temperature": 0}, response("SELECT bad"))
+    assert llm_cache.lookup("generate_sql", "m", contents("repair"), {"temperature": 0}, reusable=False) is None
+
+
+def test_replay_serves_repair_prompts(cache):
+    cache.setattr(llm_cache, "LLM_CACHE_MODE", "record")
+    llm_cache.store("m", contents("repair"), {"temperature": 0}, response("SELECT 2"), reusable=False)
+    cache.setattr(llm_cache, "LLM_CACHE_MODE", "replay")
+    assert llm_cache.lookup("generate_sql", "m", contents("repair"), {"temperature": 0}, reusable=False).text == "SELECT 2"
@@ -0,0 +1,138 @@
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.plot_reduction import OTHER, PLOT_MAX_POINTS, PlotCall, detect_plot, lttb, reduce_plot_data
+
+ROWS = PLOT_MAX_POINTS * 12
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "ts": pd.date_range("2024-01-01", periods=ROWS, freq="min"),
+        "value": np.cumsum(rng.normal(size=ROWS)),
+        "a": rng.normal(size=ROWS),
+        "b": rng.normal(size=ROWS),
+        "cat": rng.choice(list("ABCD"), ROWS),
+        "product": [f"p{i}" for i in rng.integers(0, 200, ROWS)],
+        "amount": rng.exponential(size=ROWS),
+    })
+
+
+@pytest.mark.parametrize("code, expected", [
+    ("sns.lineplot(data=df, x='ts', y='value', hue='cat')", PlotCall("lineplot", "ts", "value", "cat")),
+    ('sns.scatterplot(x="a", y="b", data=df)', PlotCall("scatterplot", "a", "b")),
+    ("sns.relplot(data=df, x='ts', y='value', kind='line')", PlotCall("lineplot", "ts", "value")),
+    ("sns.catplot(data=df, x='cat', y='amount', kind='bar')", PlotCall("barplot", "cat", "amount")),
+    ("sns.barplot(data=df, x='cat', y='amount', estimator=sum)", PlotCall("barplot", "cat", "amount", estimator="sum")),
+    ("sns.barplot(data=df, x='cat', y='amount', estimator=np.median)", PlotCall("barplot", "cat", "amount", estimator="median")),
+    ("sns.barplot(data=df, x='cat', y='amount', estimator='sum')", PlotCall("barplot", "cat", "amount", estimator="sum")),
+    ("plt.scatter(df['a'], df['b'])", PlotCall("scatterplot", "a", "b")),
+    ("plt.plot(df['ts'], df['value'])", PlotCall("lineplot", "ts", "value")),
+])
+def test_detect_plot(code, expected):
+    assert detect_plot(code) == expected
+
+
+@pytest.mark.parametrize("code", [
+    "df = df.groupby('cat').sum().reset_index()\nsns.barplot(data=df, x='cat', y='amount')",
+    "df['month'] = df['ts'].dt.month\nsns.lineplot(data=df, x='month', y='value')",
+    "df.sort_values('ts', inplace=True)\nsns.lineplot(data=df, x='ts', y='value')",
+    "sns.lineplot(data=df, x='ts', y='value')\nsns.scatterplot(data=df, x='a', y='b')",
+    "sns.barplot(data=df.head(10), x='cat', y='amount')",
+    "sns.heatmap(df.pivot_table(index='cat', columns='product', values='amount'))",
+])
+def test_detect_plot_skips_code_that_changes_or_reuses_df(code):
+    assert detect_plot(code) is None
+
+
+def test_lttb_keeps_small_series_and_bad_thresholds():
+    x = np.arange(10.0)
+    assert lttb(x, x, 10).tolist() == list(range(10))
+    assert lttb(x, x, 50).tolist() == list(range(10))
+    assert lttb(x, x, 2).tolist() == list(range(10))
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    x = np.arange(10.0)
+    y = np.array([0, 0, 5, 0, 0, 0, -5, 0, 0, 0.0])
+    selected = lttb(x, y, 5)
+    assert selected[0] == 0 and selected[-1] == 9
+    assert {2, 6} <= set(selected.tolist())
+
+
+def test_lttb_returns_sorted_unique_indices():
+    rng = np.random.default_rng(1)
+    x = np.sort(rng.uniform(size=1000))
+    selected = lttb(x, rng.normal(size=1000), 3)
+    assert len(selected) == 3
+    selected = lttb(x, np.zeros(1000), 100)
+    assert len(selected) == 100
+    assert (np.diff(selected) > 0).all()
+
+
+def test_small_frames_are_not_reduced(frame):
+    small = frame.head(PLOT_MAX_POINTS)
+    assert reduce_plot_data("sns.lineplot(data=df, x='ts', y='value')", small) is small
+
+
+def test_line_plot_is_downsampled_per_hue(frame):
+    reduced = reduce_plot_data("sns.lineplot(data=df, x='ts', y='value', hue='cat')", frame)
+    assert len(reduced) <= PLOT_MAX_POINTS
+    assert list(reduced.columns) == list(frame.columns)
+    assert set(reduced["cat"]) == set("ABCD")
+    assert (reduced.groupby("cat").size() <= PLOT_MAX_POINTS // 4).all()
+
+
+def test_line_plot_with_repeated_x_is_not_thinned(frame):
+    frame["day"] = frame["ts"].dt.floor("D")
+    assert reduce_plot_data("sns.lineplot(data=df, x='day', y='value')", frame) is frame
+
+
+def test_line_plot_of_decimal_values_is_downsampled(frame):
+    # NUMERIC columns arrive from psycopg2 as Decimal objects.
+    frame["value"] = [Decimal(str(round(v, 4))) for v in frame["value"]]
+    reduced = reduce_plot_data("sns.lineplot(data=df, x='ts', y='value')", frame)
+    assert len(reduced) <= PLOT_MAX_POINTS
+    assert pd.api.types.is_float_dtype(reduced["value"])
+
+
+def test_text_columns_are_not_made_numeric(frame):
+    frame["cat"] = frame["cat"].map({"A": "1", "B": "2", "C": "3", "D": "4"})
+    reduced = reduce_plot_data("sns.barplot(data=df, x='cat', y='amount')", frame)
+    assert set(reduced["cat"]) == {"1", "2", "3", "4"}
+
+
+def test_scatter_is_binned_with_the_same_columns(frame):
+    reduced = reduce_plot_data("sns.scatterplot(data=df, x='a', y='b', hue='cat')", frame)
+    assert len(reduced) < len(frame)
+    assert list(reduced.columns) == list(frame.columns)
+    assert reduced["a"].between(frame["a"].min(), frame["a"].max()).all()
+
+
+def test_many_categories_are_merged_into_other(frame):
+    reduced = reduce_plot_data("sns.countplot(data=df, x='product')", frame)
+    assert reduced["product"].nunique() == 20
+    assert OTHER in set(reduced["product"])
+    assert len(reduced) == len(frame)
+
+
+def test_mean_bar_plot_is_sampled_per_category(frame):
+    reduced = reduce_plot_data("sns.barplot(data=df, x='cat', y='amount')", frame)
+    assert reduced.groupby("cat").size().max() <= PLOT_MAX_POINTS
+
+
+@pytest.mark.parametrize("estimator", ["sum", "np.sum", "len", "'sum'", "lambda v: v.max()"])
+def test_bar_plot_with_other_estimators_keeps_every_row(frame, estimator):
+    reduced = reduce_plot_data(f"sns.barplot(data=df, x='cat', y='amount', estimator={estimator})", frame)
+    assert len(reduced) == len(frame)
+    pd.testing.assert_series_equal(reduced.groupby("cat")["amount"].sum(), frame.groupby("cat")["amount"].sum())
+
+
+def test_strip_plot_is_sampled(frame):
+    reduced = reduce_plot_data("sns.stripplot(data=df, x='cat', y='amount')", frame)
+    assert len(reduced) == PLOT_MAX_POINTS
@@ -0,0 +1,29 @@
+import pandas as pd
+import pyarrow as pa
+
+from services.dataset_store import rows_to_table
+from services.preview_cache import TablePreview, column_stats
+
+
+def test_stats_of_plain_columns():
+    table = pa.table({"id": [3, 1, None], "name": ["b", "a", "b"]})
+    assert column_stats("id", table["id"]) == {
+        "column": "id", "type": "int64", "nulls": 1, "distinct": 2, "min": "1", "max": "3"
+    }
+    assert column_stats("name", table["name"])["distinct"] == 2
+
+
+def test_unsupported_columns_leave_stats_empty():
+    table = rows_to_table([{"id": 1, "x": None, "tags": [1, 2], "meta": {"a": 1}}])
+    stats = TablePreview(table).stats().set_index("column")
+    assert stats.loc["id", "distinct"] == 1
+    for name in ("x", "tags", "meta"):
+        assert pd.isna(stats.loc[name, "distinct"])
+        assert pd.isna(stats.loc[name, "min"])
+
+
+def test_pages():
+    preview = TablePreview(pa.table({"n": list(range(250))}))
+    assert preview.page_count(100) == 3
+    assert preview.page(2, 100)["n"].tolist() == list(range(200, 250))
+    assert TablePreview(pa.table({"n": pa.array([], pa.int64())})).page_count(100) == 1
@@ -0,0 +1,48 @@
+import json
+
+from services import schema_profiler
+from services.schema_profiler import build_grounding, build_trigram_index, build_value_index, closest_value
+
+
+def profile(**columns):
+    tables = {"customers": {"row_estimate": 1000, "columns": {"id": {"type": "integer", "values": ["1", "2"]}, **columns}}}
+    profile = {"schema": "ds_abc", "tables": tables, "foreign_keys": []}
+    profile["value_index"] = build_value_index(profile)
+    profile["trigram_index"] = build_trigram_index(profile["value_index"])
+    return profile
+
+
+def test_values_outside_the_most_common_are_indexed():
+    index = build_value_index(profile(city={"type": "character varying", "values": ["Warsaw"], "lookup": ["Warsaw", "Szczecin"]}))
+    assert index["warsaw"] == [("customers", "city", "Warsaw")]
+    assert index["szczecin"] == [("customers", "city", "Szczecin")]
+    assert "1" not in index
+
+
+def test_single_occurrence_value_is_grounded():
+    grounding = build_grounding(
+        profile(city={"type": "character varying", "distinct": 400, "values": ["Warsaw"], "lookup": ["Szczecin"]}),
+        "How many customers live in szczecin?"
+    )
+    assert "customers.city values: 'Szczecin'" in grounding
+
+
+def test_misspelled_value_is_matched_through_trigrams():
+    values = ["Warsaw", "Krakow", "Gdansk", "Wroclaw", "Poznan", "Szczecin"]
+    trigram_index = build_trigram_index({value.lower(): [] for value in values})
+    assert closest_value("szczecn", trigram_index) == "szczecin"
+    assert closest_value("london", trigram_index) is None
+
+
+def test_grounding_is_reused_for_the_same_question(monkeypatch, tmp_path):
+    monkeypatch.setattr(schema_profiler, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(schema_profiler, "_cache", {})
+    monkeypatch.setattr(schema_profiler, "_grounding", {})
+    saved = profile(city={"type": "character varying", "values": ["Warsaw"]})
+    with open(schema_profiler.profile_path("ds_abc"), "w") as f:
+        json.dump({"schema": "ds_abc", "tables": saved["tables"], "foreign_keys": []}, f)
+    built = []
+    monkeypatch.setattr(schema_profiler, "build_grounding", lambda profile, question: built.append(question) or "x")
+    for _ in range(3):
+        assert schema_profiler.grounding_context("ds_abc", "orders in warsaw") == "x"
+    assert built == ["orders in warsaw"]
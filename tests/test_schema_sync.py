@@ -0,0 +1,94 @@
+from services.postgres_service import build_table_specs, convert_mysql_to_postgres, convert_with_cycle_support
+from services.schema_sync import hash_value, plan_sync
+
+OLD_DDL = """
+CREATE TABLE customers (
+    id INT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL
+);
+CREATE TABLE orders (
+    id INT PRIMARY KEY,
+    customer_id INT,
+    amount INT,
+    FOREIGN KEY (customer_id) REFERENCES customers(id)
+);
+"""
+
+
+def specs_for(ddl):
+    return build_table_specs(convert_with_cycle_support(convert_mysql_to_postgres(ddl)))
+
+
+def synced_state(ddl, data_hashes=None):
+    specs, enums = specs_for(ddl)
+    state = {name: {"kind": "enum", "ddl_hash": hash_value(sql), "data_hash": None, "definition": {"sql": sql}}
+             for name, sql in enums.items()}
+    for name, spec in specs.items():
+        state[name] = {"kind": "table", "ddl_hash": spec.ddl_hash, "data_hash": (data_hashes or {}).get(name, "same"),
+                       "definition": spec.definition}
+    live = {name: set(spec.columns) for name, spec in specs.items()}
+    return state, live
+
+
+def plan_for(new_ddl, data_hashes=None):
+    state, live = synced_state(OLD_DDL)
+    specs, enums = specs_for(new_ddl)
+    hashes = {name: "same" for name in specs}
+    hashes.update(data_hashes or {})
+    return plan_sync(specs, enums, hashes, state, live)
+
+
+def test_unchanged_dataset_needs_no_work():
+    plan = plan_for(OLD_DDL)
+    assert plan.rebuild_reason is None
+    assert not plan.changes_ddl
+    assert plan.reload == [] and plan.truncate == []
+
+
+def test_changed_data_reloads_table_and_referencing_tables():
+    plan = plan_for(OLD_DDL, {"customers": "changed"})
+    assert not plan.changes_ddl
+    assert set(plan.reload) == {"customers", "orders"}
+    assert plan.truncate == plan.reload
+
+
+def test_not_null_column_is_added_after_truncate():
+    new_ddl = OLD_DDL.replace("name VARCHAR(100) NOT NULL", "name VARCHAR(100) NOT NULL,\n    email VARCHAR(100) NOT NULL")
+    plan = plan_for(new_ddl)
+    assert plan.rebuild_reason is None
+    assert plan.statements == []
+    assert plan.post_truncate == ["ALTER TABLE customers ADD COLUMN email VARCHAR(100) NOT NULL;"]
+    assert "customers" in plan.truncate
+
+
+def test_type_change_is_applied_after_truncate():
+    plan = plan_for(OLD_DDL.replace("amount INT", "amount DECIMAL(10,2)"))
+    assert plan.post_truncate == ["ALTER TABLE orders ALTER COLUMN amount TYPE decimal(10,2) USING amount::decimal(10,2);"]
+    assert plan.truncate == ["orders"]
+
+
+def test_new_table_is_created_before_truncate():
+    new_ddl = OLD_DDL + """
+CREATE TABLE payments (
+    id INT PRIMARY KEY,
+    order_id INT,
+    FOREIGN KEY (order_id) REFERENCES orders(id)
+);
+"""
+    plan = plan_for(new_ddl)
+    assert len(plan.statements) == 1 and plan.statements[0].startswith("CREATE TABLE payments")
+    assert plan.post_truncate == []
+    assert plan.truncate == ["payments"]
+
+
+def test_changed_constraints_force_a_rebuild():
+    plan = plan_for(OLD_DDL.replace("FOREIGN KEY (customer_id) REFERENCES customers(id)", "UNIQUE (customer_id)"))
+    assert plan.rebuild_reason == "constraints of orders changed"
+
+
+def test_tables_changed_outside_the_sync_force_a_rebuild():
+    state, live = synced_state(OLD_DDL)
+    live["customers"].add("extra")
+    specs, enums = specs_for(OLD_DDL)
+    plan = plan_sync(specs, enums, {name: "same" for name in specs}, state, live)
+    assert plan.rebuild_reason == "columns of customers were changed outside the sync"
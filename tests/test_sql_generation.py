@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from services import sql_generation_service
+from services.schema_registry import SchemaNotLoaded
+from services.sql_generation_service import SqlRepairFailed, sql_generation
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(sql_generation_service, "SQL_CANDIDATES", 1)
+    monkeypatch.setattr(sql_generation_service, "record_query", lambda query, schema_name: None)
+
+    def generate_sql(ddl_schema, user_query, error, messages, schema_name, temperature=0.0):
+        calls.append(error)
+        return "SELECT missing FROM customers"
+
+    monkeypatch.setattr(sql_generation_service, "generate_sql", generate_sql)
+    return calls
+
+
+def test_repairs_stop_at_the_limit(calls, monkeypatch):
+    monkeypatch.setattr(sql_generation_service, "SQL_MAX_REPAIRS", 2)
+    monkeypatch.setattr(sql_generation_service, "execute_sql",
+                        lambda query, schema_name, row_limit: (None, 'column "missing" does not exist'))
+    with pytest.raises(SqlRepairFailed, match="after 2 repair attempts"):
+        sql_generation("", "question", [], "ds_abc")
+    assert calls == ["first run", 'column "missing" does not exist', 'column "missing" does not exist']
+
+
+def test_repaired_query_is_returned(calls, monkeypatch):
+    results = iter([(None, "syntax error"), (pd.DataFrame({"n": [1]}), None)])
+    monkeypatch.setattr(sql_generation_service, "execute_sql", lambda query, schema_name, row_limit: next(results))
+    query, df = sql_generation("", "question", [], "ds_abc")
+    assert calls == ["first run", "syntax error"]
+    assert df["n"].tolist() == [1]
+
+
+def test_missing_dataset_is_not_repaired(calls, monkeypatch):
+    def execute_sql(query, schema_name, row_limit):
+        raise SchemaNotLoaded("No data has been saved for this chat yet.")
+
+    monkeypatch.setattr(sql_generation_service, "execute_sql", execute_sql)
+    with pytest.raises(SchemaNotLoaded):
+        sql_generation("", "question", [], "ds_abc")
+    assert calls == ["first run"]
@@ -0,0 +1,85 @@
+import pytest
+
+from services.sql_guard import DEFAULT_ROW_LIMIT, SqlRejected, prepare_query
+
+SCHEMA = "ds_abc"
+
+
+def test_select_gets_a_default_limit_with_one_extra_row():
+    query, limit = prepare_query("SELECT * FROM customers;", SCHEMA)
+    assert query == f"SELECT * FROM customers\nLIMIT {DEFAULT_ROW_LIMIT + 1}"
+    assert limit == DEFAULT_ROW_LIMIT
+
+
+def test_row_limit_can_be_raised():
+    assert prepare_query("SELECT * FROM customers", SCHEMA, row_limit=50) == ("SELECT * FROM customers\nLIMIT 51", 50)
+
+
+def test_explicit_limit_is_kept():
+    assert prepare_query("SELECT * FROM ds_abc.customers LIMIT 5", SCHEMA) == ("SELECT * FROM ds_abc.customers LIMIT 5", None)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM ds_other.customers",
+    "SELECT * FROM customers c JOIN ds_other.orders o ON o.customer_id = c.id",
+    "SELECT * FROM customers WHERE id IN (SELECT customer_id FROM ds_other.orders)",
+    'SELECT * FROM "DS_ABC".customers',
+])
+def test_other_schemas_are_rejected(query):
+    with pytest.raises(SqlRejected, match="only tables of the current dataset"):
+        prepare_query(query, SCHEMA)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT schema_name FROM public.dataset_schemas",
+    "SELECT table_schema FROM information_schema.tables",
+    "SELECT * FROM pg_catalog.pg_namespace",
+    "SELECT * FROM pg_stats",
+    "SELECT query_to_xml('SELECT * FROM ds_other.customers', true, false, '')",
+    "SELECT set_config('search_path', 'ds_other', true)",
+])
+def test_system_objects_are_rejected(query):
+    with pytest.raises(SqlRejected):
+        prepare_query(query, SCHEMA)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT * FROM ts_stat('SELECT to_tsvector(name) FROM ds_other.customers')",
+    "SELECT * FROM pg_catalog.ts_stat('SELECT to_tsvector(name) FROM ds_other.customers')",
+    "SELECT pg_catalog.set_config('role', 'postgres', true)",
+    'SELECT "set_config"(\'search_path\', \'ds_other\', true)',
+    "SELECT pg_read_file('/etc/passwd')",
+    "SELECT ds_other.lookup(id) FROM customers",
+])
+def test_functions_outside_the_allowlist_are_rejected(query):
+    with pytest.raises(SqlRejected, match="not allowed|not accessible"):
+        prepare_query(query, SCHEMA)
+
+
+def test_common_analytics_functions_are_allowed():
+    prepare_query(
+        "SELECT date_trunc('month', created_at) AS month, age(now(), min(created_at)), make_date(2024, 1, 1), "
+        "percentile_cont(0.5) WITHIN GROUP (ORDER BY amount), string_agg(name, ', '), "
+        "row_number() OVER (ORDER BY sum(amount)) FROM orders GROUP BY 1",
+        SCHEMA
+    )
+
+
+def test_ctes_and_set_returning_functions_are_allowed():
+    prepare_query("WITH totals AS (SELECT 1 AS n) SELECT * FROM totals, generate_series(1, 3) AS g", SCHEMA)
+
+
+@pytest.mark.parametrize("query", [
+    "DELETE FROM customers",
+    "SELECT 1; DROP TABLE customers",
+    "CREATE TABLE x AS SELECT 1",
+    "SELECT * INTO copy FROM customers",
+])
+def test_writes_are_rejected(query):
+    with pytest.raises(SqlRejected):
+        prepare_query(query, SCHEMA)
+
+
+def test_unparseable_sql_is_rejected():
+    with pytest.raises(SqlRejected, match="could not be parsed"):
+        prepare_query("SELECT FROM WHERE (", SCHEMA)
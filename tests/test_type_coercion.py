@@ -0,0 +1,129 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from services.schema_sync import TableSpec, copy_table
+from services.type_coercion import CoercionError, coerce_column, coerce_dataset, coerce_table
+
+ENUMS = {"status_enum": ["active", "inactive"]}
+
+
+def spec(**columns):
+    return TableSpec("customers", "", columns, [], [], [])
+
+
+def values(series):
+    return [None if pd.isna(value) else value for value in series]
+
+
+class CopyCapture:
+    def copy_expert(self, sql, file):
+        self.sql, self.csv = sql, file.read().decode()
+
+
+def test_ints_with_fractions_are_rejected():
+    assert values(coerce_column(pd.Series(["1", 2.0, "2.5", "x", None]), "int", {})) == [1, 2, None, None, None]
+
+
+def test_numerics_keep_fractions():
+    assert values(coerce_column(pd.Series(["1.25", 3, "x"]), "decimal(10,2)", {})) == [1.25, 3.0, None]
+    assert values(coerce_column(pd.Series(["1e3"]), "double precision", {})) == [1000.0]
+
+
+def test_iso_and_mixed_dates_are_parsed():
+    parsed = coerce_column(pd.Series(["2024-01-05", "2024-01-05T10:30:00", "Jan 7, 2024 3:00 PM", "soon"]), "datetime", {})
+    assert values(parsed) == [
+        pd.Timestamp("2024-01-05"), pd.Timestamp("2024-01-05 10:30"), pd.Timestamp("2024-01-07 15:00"), None
+    ]
+
+
+@pytest.mark.parametrize("raw", [
+    ["2024-01-05T10:00:00+02:00", "2024-01-05 10:00:00"],
+    ["2024-01-05 10:00:00", "2024-01-05T10:00:00+02:00"],
+])
+def test_timestamptz_offsets_apply_only_to_their_own_values(raw):
+    parsed = dict(zip(raw, coerce_column(pd.Series(raw), "timestamp with time zone", {})))
+    assert parsed["2024-01-05T10:00:00+02:00"] == pd.Timestamp("2024-01-05 08:00", tz="UTC")
+    assert parsed["2024-01-05 10:00:00"] == pd.Timestamp("2024-01-05 10:00", tz="UTC")
+
+
+def test_offsets_are_ignored_for_timestamps_without_time_zone():
+    parsed = coerce_column(pd.Series(["2024-01-05T10:00:00+02:00", "2024-01-05 11:00:00Z", "2024-01-05"]), "timestamp", {})
+    assert pd.api.types.is_datetime64_dtype(parsed)
+    assert values(parsed) == [pd.Timestamp("2024-01-05 10:00"), pd.Timestamp("2024-01-05 11:00"), pd.Timestamp("2024-01-05")]
+
+
+def test_enum_values_outside_the_type_are_rejected():
+    assert values(coerce_column(pd.Series(["active", "deleted", None]), "status_enum", ENUMS)) == ["active", None, None]
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("Yes", True), ("t", True), ("1", True), (True, True), ("off", False), (" N ", False), (0, False), ("maybe", None)
+])
+def test_boolean_spellings(raw, expected):
+    assert values(coerce_column(pd.Series([raw]), "boolean", {})) == [expected]
+
+
+def test_varchar_length_is_enforced():
+    assert values(coerce_column(pd.Series(["abc", "abcd", ""]), "varchar(3)", {})) == ["abc", None, ""]
+    assert values(coerce_column(pd.Series(["abcd"]), "text", {})) == ["abcd"]
+
+
+def test_rejects_are_reported_per_column():
+    table = pa.table({
+        "ID": ["1", "2.5", "x", "4", "5.5"],
+        "status": ["active", "deleted", None, "active", "active"],
+        "nickname": ["a", None, "b", None, None],
+    })
+    df, rejects = coerce_table(spec(id="INT PRIMARY KEY", status="status_enum NOT NULL"), table, ENUMS)
+    assert list(df.columns) == ["id", "status", "nickname"]
+    reported = {reject.column: reject for reject in rejects}
+    assert (reported["id"].count, reported["id"].examples, reported["id"].column_type) == (3, ["2.5", "x", "5.5"], "int")
+    assert (reported["status"].count, reported["status"].examples) == (1, ["deleted"])
+    assert (reported["nickname"].column_type, reported["nickname"].count, reported["nickname"].examples) == (
+        "unknown column", 2, ["a", "b"]
+    )
+
+
+def test_dataset_with_rejects_fails_with_every_column():
+    with pytest.raises(CoercionError) as error:
+        coerce_dataset(
+            {"customers": spec(id="INT", name="VARCHAR(2)")}, {},
+            {"customers": pa.table({"id": ["1", "x"], "name": ["ab", "abc"]})}
+        )
+    assert [(r.column, r.count) for r in error.value.rejects] == [("id", 1), ("name", 1)]
+    assert "customers.name (varchar(2)): 1 rejected, e.g. 'abc'" in str(error.value)
+
+
+def test_missing_and_empty_tables_pass():
+    assert coerce_dataset({"customers": spec(id="INT")}, {}, {}) == {"customers": pa.table({})}
+
+
+def test_copy_csv_tells_null_from_empty_string():
+    tables = coerce_dataset(
+        {"customers": spec(id="INT", name="VARCHAR(20)")}, {},
+        {"customers": pa.table({"id": [1, 2, 3], "name": ["", None, 'say "hi", twice']})}
+    )
+    capture = CopyCapture()
+    copy_table(capture, "customers", tables["customers"])
+    assert capture.sql == "COPY customers (id, name) FROM STDIN WITH (FORMAT csv)"
+    # COPY's CSV format reads an unquoted empty field as NULL and "" as an empty string.
+    assert capture.csv.splitlines() == ['1,""', "2,", '3,"say ""hi"", twice"']
+
+
+def test_copy_csv_writes_nanosecond_timestamps_for_date_columns():
+    tables = coerce_dataset(
+        {"events": TableSpec("events", "", {"day": "DATE", "at": "TIMESTAMP"}, [], [], [])}, {},
+        {"events": pa.table({"day": ["2024-01-05T13:45:12.123456789", None], "at": ["2024-01-05 10:00:00", None]})}
+    )
+    capture = CopyCapture()
+    copy_table(capture, "events", tables["events"])
+    # Postgres' date input keeps the date part of a full timestamp, nanoseconds included.
+    assert capture.csv.splitlines() == ["2024-01-05 13:45:12.123456789,2024-01-05 10:00:00.000000000", ","]
+
+
+def test_copy_skips_empty_tables():
+    capture = CopyCapture()
+    copy_table(capture, "customers", None)
+    copy_table(capture, "customers", pa.table({"id": pa.array([], pa.int64())}))
+    assert not hasattr(capture, "sql")